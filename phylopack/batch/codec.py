@@ -0,0 +1,40 @@
+import os
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_EXTENSIONS = {
+    'xz': 'xz',
+    'zstd': 'zst',
+}
+
+def resolve_codec(codec):
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'xz'
+    if codec == 'zstd' and zstandard is None:
+        raise RuntimeError("zstd codec requested but the 'zstandard' module is not installed")
+    return codec
+
+def codec_from_path(path):
+    ext = os.path.splitext(path)[1].lstrip('.')
+    for codec, codec_ext in CODEC_EXTENSIONS.items():
+        if ext == codec_ext:
+            return resolve_codec(codec)
+    raise ValueError(f"Unknown codec extension for {path}")
+
+def make_compressor(codec, level):
+    if codec == 'xz':
+        return lzma.LZMACompressor(preset=6 if level is None else level)
+    return zstandard.ZstdCompressor(level=19 if level is None else level).compressobj()
+
+def make_decompressor(codec):
+    if codec == 'xz':
+        return lzma.LZMADecompressor()
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def decompress_frame(codec, data):
+    # Every frame is a self-contained xz stream / zstd frame
+    return make_decompressor(codec).decompress(data)
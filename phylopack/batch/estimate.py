@@ -0,0 +1,366 @@
+import argparse
+import os
+import time
+import json
+import csv
+import shutil
+import tempfile
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from phylopack.preorder.placement import mash_sketch
+from phylopack.preorder.sketch import PAD, load_sketch_hashes, cardinality, cardinalities, hash_matrix, merge_bottom
+from phylopack.batch.codec import CODEC_EXTENSIONS, resolve_codec
+from phylopack.preorder.catalog import genome_name
+from phylopack.batch.pack import FRAME_BYTES_DEFAULT, resolve_paths, compress_batch
+
+BYTES_PER_KMER_DEFAULT = 0.25
+
+def add_estimate_parser(subparsers):
+    estimate_parser = subparsers.add_parser("estimate", help="Plan batch cuts from the predicted compressibility of sketch unions")
+    add_estimate_args(estimate_parser)
+    estimate_parser.set_defaults(func=run_estimate)
+
+def add_estimate_args(parser):
+    parser.add_argument('order', help='Genome preorder (e.g. placement_order.txt), or placement groups with --groups')
+    parser.add_argument('input_genomes', help='Input list of genomes or genome catalog (genome_catalog.npz), used to resolve genome files')
+    parser.add_argument('-o', '--output', help='Output folder (default: current folder)', default='.')
+    parser.add_argument('--groups', action='store_true', help='The order is skeleton_tree.tsv: cut between placement groups only')
+    parser.add_argument('--exclude-skeleton', action='store_true', help='With --groups, the skeleton genomes are not part of the preorder')
+    parser.add_argument('--outliers', help='With --groups, outlier queries placed after the skeleton groups (outliers.txt)')
+    parser.add_argument('--min-genomes', type=int, default=1, help='Minimum number of genomes per batch (default: 1)')
+    parser.add_argument('--max-genomes', type=int, required=True, help='Maximum number of genomes per batch')
+    parser.add_argument('--sketch', help='Existing Mash sketch (.msh) of the genomes, sketched otherwise')
+    parser.add_argument('-k', type=int, default=21, help='K-mer size (default: 21)')
+    parser.add_argument('-s', type=int, default=1000, help='Sketch size (default: 1000)')
+    parser.add_argument('-t', type=int, default=10, help='Number of threads (default: 10)')
+    parser.add_argument(
+        '--bytes-per-kmer', type=float, default=BYTES_PER_KMER_DEFAULT,
+        help=f'Predicted compressed bytes per distinct k-mer of a batch (default: {BYTES_PER_KMER_DEFAULT})'
+    )
+    parser.add_argument('--measure', action='store_true', help='Compress the proposed batches and compare measured with predicted sizes')
+    parser.add_argument(
+        '--codec',
+        choices=['auto', 'xz', 'zstd'],
+        default='auto',
+        help='Compression codec for --measure, auto uses zstd if installed and xz otherwise (default: auto)'
+    )
+    parser.add_argument('--level', type=int, help='Compression level for --measure (default: codec default)')
+    parser.add_argument(
+        '--frame-bytes', type=int, default=FRAME_BYTES_DEFAULT,
+        help=f'Frame size for --measure (default: {FRAME_BYTES_DEFAULT})'
+    )
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+    parser.add_argument('--statistic', action='store_true', help='Output statistics file')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+
+def read_group_order(skeleton_tree, exclude_skeleton=False, outliers=None):
+    # Genomes in placement order and the group boundaries between them
+    names = []
+    boundaries = [0]
+    with open(skeleton_tree) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not fields[0]:
+                continue
+            if not exclude_skeleton:
+                names.append(fields[0])
+            for x in fields[1:]:
+                # An empty field separates the sub-groups of a split group
+                if x:
+                    names.append(x)
+                elif len(names) > boundaries[-1]:
+                    boundaries.append(len(names))
+            if len(names) > boundaries[-1]:
+                boundaries.append(len(names))
+    if outliers:
+        with open(outliers) as f:
+            names.extend(line.strip() for line in f if line.strip())
+        if len(names) > boundaries[-1]:
+            boundaries.append(len(names))
+    return names, boundaries
+
+def cut_candidates(boundaries, max_genomes):
+    # Group boundaries, plus every position inside groups that cannot fit in one batch
+    candidates = set(boundaries)
+    for lo, hi in zip(boundaries[:-1], boundaries[1:]):
+        if hi - lo > max_genomes:
+            candidates.update(range(lo + 1, hi))
+    return sorted(candidates)
+
+def union_cardinalities(hashes, lo, ends, s, k):
+    # Distinct k-mer estimate of genomes[lo:end] for every end, extending one bottom-s union
+    result = {}
+    union = np.array([], dtype=np.uint64)
+    position = lo
+    for end in ends:
+        while position < end:
+            union = np.union1d(union, hashes[position])[:s]
+            position += 1
+        result[end] = cardinality(union, s, k)
+    return result
+
+def plan_cuts(matrix, candidates, min_genomes, max_genomes, s, k, block_size=1024):
+    # Dynamic program over cut candidates: fewest undersized batches, then fewest distinct
+    # k-mers summed over batches, i.e. the most content shared within batches
+    n = candidates[-1]
+    is_candidate = np.zeros(n + 1, dtype=bool)
+    is_candidate[candidates] = True
+    undersized = np.full(n + 1, np.iinfo(np.int64).max, dtype=np.int64)
+    unique = np.full(n + 1, np.inf)
+    previous = np.full(n + 1, -1, dtype=np.int64)
+    undersized[candidates[0]] = 0
+    unique[candidates[0]] = 0.0
+
+    lengths = np.arange(1, max_genomes + 1)
+    starts = np.array(candidates[:-1], dtype=np.int64)
+    for b in range(0, len(starts), block_size):
+        block = starts[b:b + block_size]
+        # Bottom-s unions of genomes[lo:lo + length] for a block of starts, grown one genome
+        # at a time with one vectorized merge per length
+        estimates = np.zeros((len(block), max_genomes))
+        union = np.full((len(block), s), PAD, dtype=np.uint64)
+        for length in lengths:
+            # Starts are sorted: the ones still inside the order are a prefix of the block
+            live = np.searchsorted(block, n - length, side='right')
+            if live == 0:
+                break
+            union[:live] = merge_bottom(union[:live], matrix[block[:live] + length - 1], s)
+            estimates[:live, length - 1] = cardinalities(union[:live], s, k)
+
+        # Starts are final once every earlier start has been relaxed
+        for lo, row in zip(block, estimates):
+            if not np.isfinite(unique[lo]):
+                continue
+            ends = lo + lengths
+            valid = ends <= n
+            valid[valid] = is_candidate[ends[valid]]
+            ends = ends[valid]
+            cost_undersized = undersized[lo] + (ends - lo < min_genomes)
+            cost_unique = unique[lo] + row[valid]
+            better = (cost_undersized < undersized[ends]) | (
+                (cost_undersized == undersized[ends]) & (cost_unique < unique[ends])
+            )
+            undersized[ends[better]] = cost_undersized[better]
+            unique[ends[better]] = cost_unique[better]
+            previous[ends[better]] = lo
+
+    cuts = [n]
+    while previous[cuts[-1]] >= 0:
+        cuts.append(int(previous[cuts[-1]]))
+    return cuts[::-1]
+
+def describe_batches(hashes, totals, cuts, s, k, bytes_per_kmer):
+    batches = []
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        unique = union_cardinalities(hashes, lo, [hi], s, k)[hi]
+        total = float(sum(totals[lo:hi]))
+        batches.append({
+            'genomes': hi - lo,
+            'total_kmers': round(total),
+            'unique_kmers': round(unique),
+            'shared_fraction': round(1.0 - unique / total, 6) if total > 0 else 0.0,
+            'predicted_bytes': round(unique * bytes_per_kmer),
+        })
+    return batches
+
+def measure_batches(paths, cuts, codec, level, frame_bytes, threads):
+    work_dir = tempfile.mkdtemp()
+    try:
+        with ProcessPoolExecutor(max_workers=threads) as executor:
+            futures = [
+                executor.submit(
+                    compress_batch, i, paths[lo:hi],
+                    os.path.join(work_dir, f"batch_{i:05d}.fa.{CODEC_EXTENSIONS[codec]}"),
+                    codec, level, frame_bytes
+                )
+                for i, (lo, hi) in enumerate(zip(cuts[:-1], cuts[1:]))
+            ]
+            return [future.result()[0] for future in futures]
+    finally:
+        shutil.rmtree(work_dir)
+
+def run_estimate(args):
+
+    wall_start = time.time()
+    cpu_start = os.times()
+
+    if args.min_genomes > args.max_genomes:
+        raise ValueError("--min-genomes must not exceed --max-genomes")
+    if args.measure and args.frame_bytes < 1:
+        raise ValueError("--frame-bytes must be at least 1")
+
+    os.makedirs(args.output, exist_ok=True)
+
+    if args.groups:
+        names, boundaries = read_group_order(args.order, args.exclude_skeleton, args.outliers)
+    else:
+        with open(args.order) as f:
+            names = [line.strip() for line in f if line.strip()]
+        boundaries = list(range(len(names) + 1))
+    paths = resolve_paths(names, args.input_genomes, args.order)
+
+    sketch_start = time.time()
+    if args.sketch:
+        sketch = args.sketch[:-len('.msh')] if args.sketch.endswith('.msh') else args.sketch
+    else:
+        list_path = os.path.join(args.output, "estimate_genomes.txt")
+        with open(list_path, 'w') as f:
+            for p in paths:
+                f.write(p + '\n')
+        sketch, _ = mash_sketch(list_path, args.output, args.k, args.s, args.t, args.verbose)
+    by_path = load_sketch_hashes(sketch)
+    missing = [p for p in paths if p not in by_path]
+    if missing:
+        raise KeyError(f"Genomes missing from the sketch: {', '.join(missing)}")
+    hashes = [by_path[p][:args.s] for p in paths]
+    totals = [cardinality(h, args.s, args.k) for h in hashes]
+    sketch_time = time.time() - sketch_start
+
+    plan_start = time.time()
+    candidates = cut_candidates(boundaries, args.max_genomes)
+    cuts = plan_cuts(hash_matrix(hashes, args.s), candidates, args.min_genomes, args.max_genomes, args.s, args.k)
+    batches = describe_batches(hashes, totals, cuts, args.s, args.k, args.bytes_per_kmer)
+    # Baseline: fixed cuts every --max-genomes genomes, as pack --batch-genomes does
+    fixed = list(range(0, len(paths), args.max_genomes)) + [len(paths)]
+    fixed_batches = describe_batches(hashes, totals, fixed, args.s, args.k, args.bytes_per_kmer)
+    plan_time = time.time() - plan_start
+
+    measure_time = None
+    if args.measure:
+        measure_start = time.time()
+        codec = resolve_codec(args.codec)
+        for batch, measured in zip(batches, measure_batches(paths, cuts, codec, args.level, args.frame_bytes, args.t)):
+            batch['input_bytes'] = measured['input_bytes']
+            batch['measured_bytes'] = measured['output_bytes']
+        measure_time = time.time() - measure_start
+
+    plan_path = os.path.join(args.output, "batch_plan.tsv")
+    with open(plan_path, 'w') as f:
+        for i, (lo, hi) in enumerate(zip(cuts[:-1], cuts[1:])):
+            for p in paths[lo:hi]:
+                f.write(f"{genome_name(p)}\t{i}\n")
+
+    batches_path = os.path.join(args.output, "estimate_batches.tsv")
+    columns = ['batch', 'first_genome', 'genomes', 'total_kmers', 'unique_kmers', 'shared_fraction', 'predicted_bytes']
+    if args.measure:
+        columns += ['input_bytes', 'measured_bytes']
+    with open(batches_path, 'w') as f:
+        f.write('\t'.join(columns) + '\n')
+        for i, (lo, batch) in enumerate(zip(cuts[:-1], batches)):
+            row = dict(batch, batch=i, first_genome=genome_name(paths[lo]))
+            f.write('\t'.join(str(row[c]) for c in columns) + '\n')
+
+    wall_end = time.time()
+    cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    unique = sum(b['unique_kmers'] for b in batches)
+    fixed_unique = sum(b['unique_kmers'] for b in fixed_batches)
+    total = sum(b['total_kmers'] for b in batches)
+
+    stats = {
+        "parameters": {
+            "order": args.order,
+            "input_genomes": args.input_genomes,
+            "output": args.output,
+            "groups": args.groups,
+            "min_genomes": args.min_genomes,
+            "max_genomes": args.max_genomes,
+            "k": args.k,
+            "sketch_size": args.s,
+            "bytes_per_kmer": args.bytes_per_kmer,
+        },
+        "estimate": {
+            "genomes": len(paths),
+            "cut_candidates": len(candidates) - 2,
+            "batches": len(batches),
+            "undersized_batches": sum(1 for b in batches if b['genomes'] < args.min_genomes),
+            "total_kmers": total,
+            "unique_kmers": unique,
+            "shared_fraction": round(1.0 - unique / total, 6) if total else 0.0,
+            "predicted_bytes": sum(b['predicted_bytes'] for b in batches),
+            "fixed_cut_batches": len(fixed_batches),
+            "fixed_cut_unique_kmers": fixed_unique,
+            "fixed_cut_predicted_bytes": sum(b['predicted_bytes'] for b in fixed_batches),
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(wall_end - wall_start, 4),
+                "user_time": round(cpu_end.user - cpu_start.user, 4),
+                "system_time": round(cpu_end.system - cpu_start.system, 4)
+            },
+            "sketch": {"wall_time": round(sketch_time, 4)},
+            "planning": {"wall_time": round(plan_time, 4)}
+        },
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.measure:
+        predicted = np.array([b['predicted_bytes'] for b in batches], dtype=np.float64)
+        measured = np.array([b['measured_bytes'] for b in batches], dtype=np.float64)
+        distinct = np.array([b['unique_kmers'] for b in batches], dtype=np.float64)
+        # Least-squares bytes per distinct k-mer through the origin, to pass as --bytes-per-kmer
+        fitted = float((distinct * measured).sum() / (distinct ** 2).sum()) if distinct.any() else None
+        stats["measurement"] = {
+            "measured_bytes": int(measured.sum()),
+            "predicted_bytes": int(predicted.sum()),
+            "mean_abs_relative_error": round(float(np.mean(np.abs(predicted - measured) / np.maximum(measured, 1))), 6),
+            "correlation": round(float(np.corrcoef(distinct, measured)[0, 1]), 6) if len(batches) > 1 and distinct.std() > 0 and measured.std() > 0 else None,
+            "fitted_bytes_per_kmer": round(fitted, 6) if fitted is not None else None,
+        }
+        stats["timings"]["measure"] = {"wall_time": round(measure_time, 4)}
+
+    if args.verbose:
+        print(f"[INFO] Proposed {len(batches)} batches from {len(candidates) - 2} cut candidates")
+        print(f"[INFO] Predicted distinct k-mers: {unique} (fixed cuts: {fixed_unique})")
+        if args.measure:
+            print(
+                f"[INFO] Predicted {stats['measurement']['predicted_bytes']} bytes, "
+                f"measured {stats['measurement']['measured_bytes']} bytes"
+            )
+        print(f"[INFO] Batch plan written to {plan_path}")
+        print(f'[INFO] Estimation elapsed time: {round(wall_end - wall_start, 4)}s')
+
+    if args.statistic:
+        stats_path = os.path.join(args.output, f"estimate_stats.{args.statistic_file_type}")
+        if args.statistic_file_type == 'json':
+            with open(stats_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+        elif args.statistic_file_type == 'csv':
+            with open(stats_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Category', 'Key', 'Value'])
+                for k, v in stats['parameters'].items():
+                    writer.writerow(['parameter', k, v])
+                for k, v in stats['estimate'].items():
+                    writer.writerow(['estimate', k, v])
+                for k, v in stats.get('measurement', {}).items():
+                    writer.writerow(['measurement', k, v])
+                for k, v in stats['timings'].items():
+                    for sub_k, sub_v in v.items():
+                        writer.writerow(['timing', f"{k}.{sub_k}", sub_v])
+                for k, v in stats['resources'].items():
+                    writer.writerow(['resource', k, v])
+        if args.verbose:
+            print(f"[INFO] Statistics saved to: {stats_path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Propose batch cuts sharing the most k-mer content, predicted from sketch unions without compressing'
+    )
+    add_estimate_args(parser)
+    args = parser.parse_args()
+    run_estimate(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import os
+import time
+import json
+import csv
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+from phylopack.batch.codec import codec_from_path, decompress_frame, make_decompressor
+from phylopack.batch.index import read_index
+
+CHUNK_SIZE = 1 << 20
+
+def add_extract_parser(subparsers):
+    extract_parser = subparsers.add_parser("extract", help="Extract genomes from packed batches")
+    add_extract_args(extract_parser)
+    extract_parser.set_defaults(func=run_extract)
+
+def add_extract_args(parser):
+    parser.add_argument('packed', help='Folder written by phylopack pack (batches and index)')
+    parser.add_argument('genomes', nargs='*', help='Genome IDs to extract')
+    parser.add_argument('-l', '--genome-list', help='File with one genome ID per line to extract')
+    parser.add_argument('-o', '--output', help='Output folder (default: current folder)', default='.')
+    parser.add_argument('-t', type=int, default=10, help='Number of worker processes (default: 10)')
+    parser.add_argument('--benchmark', action='store_true', help='Also time full decompression of the touched batches')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+    parser.add_argument('--statistic', action='store_true', help='Output statistics file')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+
+def extract_from_batch(batch_path, frames, records, output):
+    start = time.time()
+    codec = codec_from_path(batch_path)
+    cache = {}
+    frames_decoded = 0
+    extracted_bytes = 0
+
+    with open(batch_path, 'rb') as batch:
+
+        def frame_data(idx):
+            nonlocal frames_decoded
+            if idx not in cache:
+                fr = frames[idx]
+                batch.seek(fr['compressed_offset'])
+                cache[idx] = decompress_frame(codec, batch.read(fr['compressed_size']))
+                frames_decoded += 1
+            return cache[idx]
+
+        for record in sorted(records, key=lambda r: (r['frame'], r['offset'])):
+            # Frames before this genome's first frame are no longer needed
+            for idx in [i for i in cache if i < record['frame']]:
+                del cache[idx]
+
+            idx, offset, remaining = record['frame'], record['offset'], record['length']
+            with open(os.path.join(output, record['genome']), 'wb') as out:
+                while remaining > 0:
+                    data = frame_data(idx)
+                    piece = data[offset:offset + remaining]
+                    out.write(piece)
+                    remaining -= len(piece)
+                    idx += 1
+                    offset = 0
+            extracted_bytes += record['length']
+
+    return {
+        'file': os.path.basename(batch_path),
+        'genomes': len(records),
+        'frames_decoded': frames_decoded,
+        'frames_total': len(frames),
+        'extracted_bytes': extracted_bytes,
+        'wall_time': round(time.time() - start, 4),
+    }
+
+def decompress_batch(batch_path):
+    start = time.time()
+    codec = codec_from_path(batch_path)
+    total = 0
+    with open(batch_path, 'rb') as batch:
+        decompressor = make_decompressor(codec)
+        while True:
+            chunk = batch.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            while chunk:
+                total += len(decompressor.decompress(chunk))
+                # Concatenated frames: restart on the bytes left after each frame end
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = make_decompressor(codec)
+                else:
+                    chunk = b''
+    return total, time.time() - start
+
+def run_extract(args):
+
+    full_start = time.time()
+    full_cpu_start = os.times()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    genome_ids = list(args.genomes)
+    if args.genome_list:
+        with open(args.genome_list) as f:
+            genome_ids.extend(line.strip() for line in f if line.strip())
+
+    records, frames = read_index(args.packed)
+
+    missing = [g for g in genome_ids if g not in records]
+    if missing:
+        raise KeyError(f"Genomes not found in {args.packed} index: {', '.join(missing)}")
+
+    by_batch = {}
+    for g in dict.fromkeys(genome_ids):
+        by_batch.setdefault(records[g]['batch'], []).append(records[g])
+
+    if args.verbose:
+        print(f"[INFO] Extracting {sum(len(r) for r in by_batch.values())} genomes from {len(by_batch)} batches")
+
+    extract_start = time.time()
+    # Batches holding only empty genomes have no frames in the index
+    with ProcessPoolExecutor(max_workers=args.t) as executor:
+        futures = [
+            executor.submit(extract_from_batch, os.path.join(args.packed, batch), frames.get(batch, []), recs, args.output)
+            for batch, recs in by_batch.items()
+        ]
+        batch_stats = [future.result() for future in futures]
+    extract_time = time.time() - extract_start
+
+    extracted_bytes = sum(b['extracted_bytes'] for b in batch_stats)
+
+    benchmark = {}
+    if args.benchmark:
+        full_dec_start = time.time()
+        with ProcessPoolExecutor(max_workers=args.t) as executor:
+            results = list(executor.map(decompress_batch, [os.path.join(args.packed, b) for b in by_batch]))
+        full_dec_time = time.time() - full_dec_start
+        decompressed_bytes = sum(r[0] for r in results)
+        benchmark = {
+            "extract_wall_time": round(extract_time, 4),
+            "extract_throughput_MBps": round(extracted_bytes / 1e6 / extract_time, 4) if extract_time > 0 else None,
+            "full_decompression_wall_time": round(full_dec_time, 4),
+            "full_decompression_bytes": decompressed_bytes,
+            "full_decompression_throughput_MBps": round(decompressed_bytes / 1e6 / full_dec_time, 4) if full_dec_time > 0 else None,
+            "speedup": round(full_dec_time / extract_time, 4) if extract_time > 0 else None,
+        }
+        if args.verbose:
+            print(f"[INFO] Extraction {round(extract_time, 4)}s vs full decompression {round(full_dec_time, 4)}s")
+
+    full_end = time.time()
+    full_cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    if args.verbose:
+        print(f"[INFO] Extracted {extracted_bytes} bytes to {args.output}")
+        print(f'[INFO] Extraction elapsed time: {round(full_end - full_start, 4)}s')
+
+    stats = {
+        "parameters": {
+            "packed": args.packed,
+            "output": args.output,
+            "genomes": sum(b['genomes'] for b in batch_stats),
+            "batches": len(batch_stats),
+            "threads": args.t,
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(full_end - full_start, 4),
+                "user_time": round(full_cpu_end.user - full_cpu_start.user, 4),
+                "system_time": round(full_cpu_end.system - full_cpu_start.system, 4)
+            }
+        },
+        "benchmark": benchmark,
+        "batches": batch_stats,
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.statistic:
+        stats_path = os.path.join(args.output, f"extract_stats.{args.statistic_file_type}")
+        if args.statistic_file_type == 'json':
+            with open(stats_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+        elif args.statistic_file_type == 'csv':
+            with open(stats_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Category', 'Key', 'Value'])
+                for k, v in stats['parameters'].items():
+                    writer.writerow(['parameter', k, v])
+                for k, v in stats['timings']['total'].items():
+                    writer.writerow(['timing', f"total.{k}", v])
+                for k, v in stats['benchmark'].items():
+                    writer.writerow(['benchmark', k, v])
+                for batch in stats['batches']:
+                    for k, v in batch.items():
+                        if k != 'file':
+                            writer.writerow(['batch', f"{batch['file']}.{k}", v])
+                for k, v in stats['resources'].items():
+                    writer.writerow(['resource', k, v])
+        if args.verbose:
+            print(f"[INFO] Statistics saved to: {stats_path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Extract genomes from packed batches, decoding only the frames they span'
+    )
+    add_extract_args(parser)
+    args = parser.parse_args()
+    if not args.genomes and not args.genome_list:
+        parser.error("genome IDs or --genome-list are required")
+    run_extract(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import csv
+
+INDEX_FILE = "index.tsv"
+FRAMES_FILE = "frames.tsv"
+
+INDEX_HEADER = ['genome', 'batch', 'frame', 'offset', 'length']
+FRAMES_HEADER = ['batch', 'frame', 'compressed_offset', 'compressed_size', 'uncompressed_size']
+
+def _write_tsv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([row[k] for k in header])
+
+def _read_tsv(path):
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        return [
+            {k: (v if k in ('genome', 'batch') else int(v)) for k, v in row.items()}
+            for row in reader
+        ]
+
+def write_index(output, records, frames):
+    _write_tsv(os.path.join(output, INDEX_FILE), INDEX_HEADER, records)
+    _write_tsv(os.path.join(output, FRAMES_FILE), FRAMES_HEADER, frames)
+
+def read_index(packed_dir):
+    records = {r['genome']: r for r in _read_tsv(os.path.join(packed_dir, INDEX_FILE))}
+    frames = {}
+    for fr in _read_tsv(os.path.join(packed_dir, FRAMES_FILE)):
+        frames.setdefault(fr['batch'], []).append(fr)
+    for batch_frames in frames.values():
+        batch_frames.sort(key=lambda fr: fr['frame'])
+    return records, frames
@@ -0,0 +1,312 @@
+import argparse
+import os
+import time
+import json
+import csv
+import gzip
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+from phylopack.batch.codec import CODEC_EXTENSIONS, resolve_codec, make_compressor
+from phylopack.batch.index import write_index
+from phylopack.batch.plan import read_batch_plan
+from phylopack.preorder.catalog import genome_name, load_catalog
+
+CHUNK_SIZE = 1 << 20
+FRAME_BYTES_DEFAULT = 8 << 20
+
+def add_pack_parser(subparsers):
+    pack_parser = subparsers.add_parser("pack", help="Compress genomes in preorder batches")
+    add_pack_args(pack_parser)
+    pack_parser.set_defaults(func=run_pack)
+
+def add_pack_args(parser):
+    parser.add_argument('preorder', help='Path to the genome preorder (e.g. placement_order.txt)')
+    parser.add_argument('input_genomes', help='Input list of genomes or genome catalog (genome_catalog.npz), used to resolve genome files')
+    parser.add_argument('-o', '--output', help='Output folder (default: current folder)', default='.')
+    parser.add_argument('--batch-genomes', type=int, help='Maximum number of genomes per batch')
+    parser.add_argument('--batch-bytes', type=int, help='Maximum input size (gzipped bytes on disk) per batch')
+    parser.add_argument('--batch-plan', help='Batch assignments from phylopack plan (batch_plan.tsv)')
+    parser.add_argument(
+        '--codec',
+        choices=['auto', 'xz', 'zstd'],
+        default='auto',
+        help='Compression codec, auto uses zstd if installed and xz otherwise (default: auto)'
+    )
+    parser.add_argument('--level', type=int, help='Compression level (default: codec default)')
+    parser.add_argument(
+        '--frame-bytes', type=int, default=FRAME_BYTES_DEFAULT,
+        help=f'Maximum uncompressed size of an independently decodable frame (default: {FRAME_BYTES_DEFAULT})'
+    )
+    parser.add_argument('-t', type=int, default=10, help='Number of worker processes (default: 10)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+    parser.add_argument('--statistic', action='store_true', help='Output statistics file')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+
+def resolve_paths(names, input_genomes, source):
+    catalog = load_catalog(input_genomes)
+    paths = []
+    for name, i in zip(names, catalog.lookup(names)):
+        if i >= 0:
+            paths.append(catalog.path(i))
+        elif os.path.isfile(name):
+            paths.append(name)
+        else:
+            raise KeyError(f"Genome '{name}' from {source} not found in {input_genomes}")
+    return paths
+
+def read_preorder(preorder, input_genomes):
+    with open(preorder) as f:
+        names = [line.strip() for line in f if line.strip()]
+    return resolve_paths(names, input_genomes, preorder)
+
+def cut_batches(paths, batch_genomes=None, batch_bytes=None):
+    batches = []
+    current = []
+    current_bytes = 0
+    for path in paths:
+        size = os.path.getsize(path) if batch_bytes else 0
+        full = (
+            (batch_genomes and len(current) >= batch_genomes)
+            or (batch_bytes and current and current_bytes + size > batch_bytes)
+        )
+        if full:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(path)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+def cut_batches_from_plan(paths, plan):
+    batches = []
+    previous = None
+    for path in paths:
+        name = genome_name(path)
+        if name not in plan:
+            raise KeyError(f"Genome '{name}' not found in the batch plan")
+        if not batches or plan[name] != previous:
+            batches.append([])
+            previous = plan[name]
+        batches[-1].append(path)
+    return batches
+
+def compress_batch(batch_id, paths, out_path, codec, level, frame_bytes):
+    start = time.time()
+    batch_file = os.path.basename(out_path)
+    compressor = make_compressor(codec, level)
+    input_bytes = 0
+    output_bytes = 0
+    frame = 0
+    frame_start = 0
+    in_frame = 0
+    frames = []
+    records = []
+
+    with open(out_path, 'wb') as out:
+        for path in paths:
+            record = {
+                'genome': genome_name(path),
+                'batch': batch_file,
+                'frame': frame,
+                'offset': in_frame,
+                'length': 0,
+            }
+            with gzip.open(path, 'rb') as fasta:
+                while True:
+                    chunk = fasta.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    record['length'] += len(chunk)
+                    input_bytes += len(chunk)
+                    while chunk:
+                        # Split the chunk on frame boundaries so every frame stays bounded
+                        take = min(len(chunk), frame_bytes - in_frame)
+                        data = compressor.compress(chunk[:take])
+                        output_bytes += len(data)
+                        out.write(data)
+                        chunk = chunk[take:]
+                        in_frame += take
+                        if in_frame == frame_bytes:
+                            data = compressor.flush()
+                            output_bytes += len(data)
+                            out.write(data)
+                            frames.append({
+                                'batch': batch_file,
+                                'frame': frame,
+                                'compressed_offset': frame_start,
+                                'compressed_size': output_bytes - frame_start,
+                                'uncompressed_size': in_frame,
+                            })
+                            frame += 1
+                            frame_start = output_bytes
+                            in_frame = 0
+                            compressor = make_compressor(codec, level)
+            if record['length'] == 0:
+                # Empty genome: anchor it on the frame currently being filled
+                record['frame'], record['offset'] = frame, in_frame
+            records.append(record)
+
+        if in_frame > 0:
+            data = compressor.flush()
+            output_bytes += len(data)
+            out.write(data)
+            frames.append({
+                'batch': batch_file,
+                'frame': frame,
+                'compressed_offset': frame_start,
+                'compressed_size': output_bytes - frame_start,
+                'uncompressed_size': in_frame,
+            })
+
+    wall_time = time.time() - start
+
+    return {
+        'batch': batch_id,
+        'file': batch_file,
+        'genomes': len(paths),
+        'frames': len(frames),
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'ratio': round(input_bytes / output_bytes, 4) if output_bytes else None,
+        'wall_time': round(wall_time, 4),
+        'throughput_MBps': round(input_bytes / 1e6 / wall_time, 4) if wall_time > 0 else None,
+    }, records, frames
+
+def run_pack(args):
+
+    full_start = time.time()
+    full_cpu_start = os.times()
+
+    if args.batch_genomes is None and args.batch_bytes is None and args.batch_plan is None:
+        raise ValueError("one of --batch-genomes, --batch-bytes or --batch-plan is required")
+    if args.frame_bytes < 1:
+        raise ValueError("--frame-bytes must be at least 1")
+
+    os.makedirs(args.output, exist_ok=True)
+    codec = resolve_codec(args.codec)
+
+    paths = read_preorder(args.preorder, args.input_genomes)
+    if args.batch_plan:
+        batches = cut_batches_from_plan(paths, read_batch_plan(args.batch_plan))
+    else:
+        batches = cut_batches(paths, args.batch_genomes, args.batch_bytes)
+
+    if args.verbose:
+        print(f"[INFO] Packing {len(paths)} genomes into {len(batches)} batches with {codec}")
+
+    batch_files = [
+        os.path.join(args.output, f"batch_{i:05d}.fa.{CODEC_EXTENSIONS[codec]}")
+        for i in range(len(batches))
+    ]
+
+    with ProcessPoolExecutor(max_workers=args.t) as executor:
+        futures = [
+            executor.submit(compress_batch, i, batch, batch_files[i], codec, args.level, args.frame_bytes)
+            for i, batch in enumerate(batches)
+        ]
+        batch_stats = []
+        index_records = []
+        index_frames = []
+        for future in futures:
+            result, records, frames = future.result()
+            batch_stats.append(result)
+            index_records.extend(records)
+            index_frames.extend(frames)
+            if args.verbose:
+                print(
+                    f"[INFO] Batch {result['batch']}: {result['genomes']} genomes, "
+                    f"ratio {result['ratio']}, {result['throughput_MBps']} MB/s"
+                )
+
+    write_index(args.output, index_records, index_frames)
+
+    full_end = time.time()
+    full_cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    input_bytes = sum(b['input_bytes'] for b in batch_stats)
+    output_bytes = sum(b['output_bytes'] for b in batch_stats)
+    wall_time = full_end - full_start
+
+    if args.verbose:
+        print(f"[INFO] Packed {input_bytes} bytes into {output_bytes} bytes")
+        print(f'[INFO] Packing elapsed time: {round(wall_time, 4)}s')
+
+    stats = {
+        "parameters": {
+            "preorder": args.preorder,
+            "input_genomes": args.input_genomes,
+            "output": args.output,
+            "codec": codec,
+            "level": args.level,
+            "batch_genomes": args.batch_genomes,
+            "batch_bytes": args.batch_bytes,
+            "batch_plan": args.batch_plan,
+            "frame_bytes": args.frame_bytes,
+            "threads": args.t,
+            "batch_count": len(batches),
+            "frame_count": len(index_frames),
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(wall_time, 4),
+                "user_time": round(full_cpu_end.user - full_cpu_start.user, 4),
+                "system_time": round(full_cpu_end.system - full_cpu_start.system, 4)
+            }
+        },
+        "compression": {
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "ratio": round(input_bytes / output_bytes, 4) if output_bytes else None,
+            "throughput_MBps": round(input_bytes / 1e6 / wall_time, 4) if wall_time > 0 else None,
+        },
+        "batches": batch_stats,
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2),
+            "max_rss_workers_MB": round(children.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.statistic:
+        stats_path = os.path.join(args.output, f"pack_stats.{args.statistic_file_type}")
+        if args.statistic_file_type == 'json':
+            with open(stats_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+        elif args.statistic_file_type == 'csv':
+            with open(stats_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Category', 'Key', 'Value'])
+                for k, v in stats['parameters'].items():
+                    writer.writerow(['parameter', k, v])
+                for k, v in stats['timings']['total'].items():
+                    writer.writerow(['timing', f"total.{k}", v])
+                for k, v in stats['compression'].items():
+                    writer.writerow(['compression', k, v])
+                for batch in stats['batches']:
+                    for k, v in batch.items():
+                        if k != 'batch':
+                            writer.writerow(['batch', f"{batch['batch']}.{k}", v])
+                for k, v in stats['resources'].items():
+                    writer.writerow(['resource', k, v])
+        if args.verbose:
+            print(f"[INFO] Statistics saved to: {stats_path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compress genomes in preorder-ordered batches, one process per batch'
+    )
+    add_pack_args(parser)
+    args = parser.parse_args()
+    run_pack(args)
+
+if __name__ == "__main__":
+    main()
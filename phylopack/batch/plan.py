@@ -0,0 +1,217 @@
+import argparse
+import os
+import time
+import json
+import csv
+import resource
+
+import ete3
+
+def add_plan_parser(subparsers):
+    plan_parser = subparsers.add_parser("plan", help="Plan clade-aware batch boundaries from the skeleton tree")
+    add_plan_args(plan_parser)
+    plan_parser.set_defaults(func=run_plan)
+
+def add_plan_args(parser):
+    parser.add_argument('tree', help='Skeleton tree in Newick format (e.g. tree_std.nw)')
+    parser.add_argument('skeleton_tree', help='Placement groups per skeleton leaf (skeleton_tree.tsv)')
+    parser.add_argument('-o', '--output', help='Output folder (default: current folder)', default='.')
+    parser.add_argument('--min-genomes', type=int, required=True, help='Minimum number of genomes per batch')
+    parser.add_argument('--max-genomes', type=int, required=True, help='Maximum number of genomes per batch')
+    parser.add_argument('--exclude-skeleton', action='store_true', help='The skeleton genomes are not part of the preorder')
+    parser.add_argument('--outliers', help='Outlier queries placed after the skeleton groups (outliers.txt)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+    parser.add_argument('--statistic', action='store_true', help='Output statistics file')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+
+def load_groups(skeleton_tree, exclude_skeleton=False):
+    # Sub-groups per leaf: an empty field separates the sub-groups of a split group
+    groups = {}
+    with open(skeleton_tree) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not fields[0]:
+                continue
+            subgroups = [[] if exclude_skeleton else [fields[0]]]
+            for x in fields[1:]:
+                if x:
+                    subgroups[-1].append(x)
+                elif subgroups[-1]:
+                    subgroups.append([])
+            groups[fields[0]] = [sub for sub in subgroups if sub]
+    return groups
+
+def clade_segments(tree, groups, max_genomes):
+    # Postorder pass: genome count under every node
+    size = {}
+    for node in tree.traverse('postorder'):
+        if node.is_leaf():
+            size[node] = sum(len(sub) for sub in groups.get(node.name, []))
+        else:
+            size[node] = sum(size[c] for c in node.children)
+
+    # Preorder pass: keep the largest clades that fit, in tree order
+    segments = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if size[node] == 0:
+            continue
+        if size[node] <= max_genomes:
+            genomes = [g for leaf in node.iter_leaves() for sub in groups.get(leaf.name, []) for g in sub]
+            segments.append((node.name, genomes))
+        elif node.is_leaf():
+            # Over-full group: one segment per sub-group, cut further only if still too large
+            for sub in groups[node.name]:
+                for i in range(0, len(sub), max_genomes):
+                    segments.append((node.name, sub[i:i + max_genomes]))
+        else:
+            stack.extend(reversed(node.children))
+    return segments
+
+def merge_segments(segments, min_genomes, max_genomes):
+    batches = []
+    current = []
+    split_clades = 0
+    for _, genomes in segments:
+        if len(current) + len(genomes) <= max_genomes:
+            current.extend(genomes)
+        elif len(current) >= min_genomes:
+            batches.append(current)
+            current = list(genomes)
+        else:
+            # No clade boundary keeps the batch within bounds, split this clade
+            take = max_genomes - len(current)
+            current.extend(genomes[:take])
+            batches.append(current)
+            current = list(genomes[take:])
+            split_clades += 1
+    if current and len(current) < min_genomes and batches:
+        # The previous batch closed because both did not fit together: move its tail over
+        take = min_genomes - len(current)
+        if len(batches[-1]) - take >= min_genomes:
+            current = batches[-1][-take:] + current
+            del batches[-1][-take:]
+            split_clades += 1
+    if current:
+        batches.append(current)
+    return batches, split_clades
+
+def read_batch_plan(plan_file):
+    plan = {}
+    with open(plan_file) as f:
+        for line in f:
+            if line.strip():
+                genome, batch = line.rstrip('\n').split('\t')[:2]
+                plan[genome] = int(batch)
+    return plan
+
+def run_plan(args):
+
+    wall_start = time.time()
+    cpu_start = os.times()
+
+    if args.min_genomes > args.max_genomes:
+        raise ValueError("--min-genomes must not exceed --max-genomes")
+
+    os.makedirs(args.output, exist_ok=True)
+
+    tree = ete3.Tree(args.tree, format=1)
+    groups = load_groups(args.skeleton_tree, args.exclude_skeleton)
+
+    missing = [leaf.name for leaf in tree.iter_leaves() if leaf.name not in groups]
+    if missing:
+        raise KeyError(f"Tree leaves not found in {args.skeleton_tree}: {', '.join(missing)}")
+
+    segments = clade_segments(tree, groups, args.max_genomes)
+
+    if args.outliers:
+        with open(args.outliers) as f:
+            outliers = [line.strip() for line in f if line.strip()]
+        for i in range(0, len(outliers), args.max_genomes):
+            segments.append(("outliers", outliers[i:i + args.max_genomes]))
+    batches, split_clades = merge_segments(segments, args.min_genomes, args.max_genomes)
+
+    plan_path = os.path.join(args.output, "batch_plan.tsv")
+    with open(plan_path, 'w') as f:
+        for i, batch in enumerate(batches):
+            for genome in batch:
+                f.write(f"{genome}\t{i}\n")
+
+    wall_end = time.time()
+    cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    sizes = [len(b) for b in batches]
+
+    if args.verbose:
+        print(f"[INFO] Planned {len(batches)} batches from {len(segments)} clades, {split_clades} clades split")
+        print(f"[INFO] Batch plan written to {plan_path}")
+        print(f'[INFO] Planning elapsed time: {round(wall_end - wall_start, 4)}s')
+
+    stats = {
+        "parameters": {
+            "tree": args.tree,
+            "skeleton_tree": args.skeleton_tree,
+            "outliers": args.outliers,
+            "output": args.output,
+            "min_genomes": args.min_genomes,
+            "max_genomes": args.max_genomes,
+            "exclude_skeleton": args.exclude_skeleton,
+        },
+        "plan": {
+            "genomes": sum(sizes),
+            "clades": len(segments),
+            "batches": len(batches),
+            "split_clades": split_clades,
+            "min_batch_size": min(sizes, default=0),
+            "max_batch_size": max(sizes, default=0),
+            "undersized_batches": sum(1 for s in sizes if s < args.min_genomes),
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(wall_end - wall_start, 4),
+                "user_time": round(cpu_end.user - cpu_start.user, 4),
+                "system_time": round(cpu_end.system - cpu_start.system, 4)
+            }
+        },
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.statistic:
+        stats_path = os.path.join(args.output, f"plan_stats.{args.statistic_file_type}")
+        if args.statistic_file_type == 'json':
+            with open(stats_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+        elif args.statistic_file_type == 'csv':
+            with open(stats_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Category', 'Key', 'Value'])
+                for k, v in stats['parameters'].items():
+                    writer.writerow(['parameter', k, v])
+                for k, v in stats['plan'].items():
+                    writer.writerow(['plan', k, v])
+                for k, v in stats['timings']['total'].items():
+                    writer.writerow(['timing', f"total.{k}", v])
+                for k, v in stats['resources'].items():
+                    writer.writerow(['resource', k, v])
+        if args.verbose:
+            print(f"[INFO] Statistics saved to: {stats_path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cut the skeleton tree into clades holding between --min-genomes and --max-genomes genomes'
+    )
+    add_plan_args(parser)
+    args = parser.parse_args()
+    run_plan(args)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,12 @@ import shutil
 import sys
 import argparse
 from phylopack.preorder.preorder import add_preorder_parser
+from phylopack.preorder.serve import add_serve_parser
+from phylopack.preorder.evaluate import add_evaluate_parser
+from phylopack.batch.pack import add_pack_parser
+from phylopack.batch.extract import add_extract_parser
+from phylopack.batch.plan import add_plan_parser
+from phylopack.batch.estimate import add_estimate_parser
 
 
 def check_dependencies(tools=["mash", "quicktree", "attotree"]):
@@ -18,6 +24,24 @@ def main():
     # Add the 'preorder' command from the preorder module
     add_preorder_parser(subparsers)
 
+    # Add the 'evaluate' command from the preorder module
+    add_evaluate_parser(subparsers)
+
+    # Add the 'serve' command from the preorder module
+    add_serve_parser(subparsers)
+
+    # Add the 'plan' command from the batch module
+    add_plan_parser(subparsers)
+
+    # Add the 'estimate' command from the batch module
+    add_estimate_parser(subparsers)
+
+    # Add the 'pack' command from the batch module
+    add_pack_parser(subparsers)
+
+    # Add the 'extract' command from the batch module
+    add_extract_parser(subparsers)
+
     args = parser.parse_args()
     args.func(args)
 
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+CATALOG_FILE = "genome_catalog.npz"
+ID_DTYPE = np.int32
+
+def genome_name(path):
+    # attotree's leaf naming, used by every stage: basename without the last extension
+    parts = os.path.basename(path.strip()).split('.')
+    return '.'.join(parts[:-1]) if len(parts) > 1 else parts[0]
+
+class GenomeCatalog:
+    # Genomes of a run under dense integer IDs (input order): names as one fixed-width
+    # byte array with a sorted index for lookups, paths as one byte blob with offsets
+    def __init__(self, names, order, path_data, path_offsets):
+        self.names_array = names
+        self.order = order
+        self.sorted_names = names[order]
+        self.path_data = path_data
+        self.path_offsets = path_offsets
+
+    @classmethod
+    def from_paths(cls, paths):
+        # Paths are consumed one at a time, only their encoded bytes are kept
+        path_data = bytearray()
+        lengths = []
+        names = []
+        for p in paths:
+            encoded = p.encode()
+            path_data += encoded
+            lengths.append(len(encoded))
+            names.append(genome_name(p).encode())
+        names = np.array(names, dtype=bytes)
+        lengths = np.array(lengths, dtype=np.int64)
+        path_data = np.frombuffer(bytes(path_data), dtype=np.uint8)
+        path_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=path_offsets[1:])
+
+        order = np.argsort(names, kind='stable')
+        dup = np.flatnonzero(names[order][1:] == names[order][:-1])
+        if len(dup):
+            # A path listed twice keeps its first ID, different files under one name are an error
+            keep = np.ones(len(names), dtype=bool)
+            duplicated = set()
+            for a, b in zip(order[dup], order[dup + 1]):
+                if path_data[path_offsets[a]:path_offsets[a + 1]].tobytes() == path_data[path_offsets[b]:path_offsets[b + 1]].tobytes():
+                    keep[b] = False
+                else:
+                    duplicated.add(names[b].decode())
+            if duplicated:
+                raise ValueError(f"Genomes sharing a name: {', '.join(sorted(duplicated))}")
+            path_data = path_data[np.repeat(keep, lengths)]
+            names = names[keep]
+            lengths = lengths[keep]
+            path_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=path_offsets[1:])
+            order = np.argsort(names, kind='stable')
+
+        return cls(names, order.astype(ID_DTYPE), path_data, path_offsets)
+
+    @classmethod
+    def from_list(cls, *genomes_lists):
+        return cls.from_paths(p for genomes_list in genomes_lists for p in read_paths(genomes_list))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['names'], data['order'], data['path_data'], data['path_offsets'])
+
+    def save(self, path):
+        np.savez(
+            path, names=self.names_array, order=self.order,
+            path_data=self.path_data, path_offsets=self.path_offsets
+        )
+
+    def __len__(self):
+        return len(self.names_array)
+
+    def name(self, i):
+        return self.names_array[i].decode()
+
+    def path(self, i):
+        return self.path_data[self.path_offsets[i]:self.path_offsets[i + 1]].tobytes().decode()
+
+    def names(self, ids):
+        return [self.name(i) for i in ids]
+
+    def paths(self, ids):
+        return [self.path(i) for i in ids]
+
+    def lookup(self, names):
+        # IDs of the given names, -1 for names not in the catalog
+        if len(self) == 0:
+            return np.full(len(names), -1, dtype=ID_DTYPE)
+        query = np.array([n.encode() for n in names], dtype=bytes)
+        pos = np.minimum(np.searchsorted(self.sorted_names, query), len(self) - 1)
+        found = self.sorted_names[pos] == query
+        return np.where(found, self.order[pos], -1).astype(ID_DTYPE)
+
+    def ids(self, names, source=None):
+        ids = self.lookup(names)
+        if (ids < 0).any():
+            missing = [n for n, i in zip(names, ids) if i < 0]
+            where = f" from {source}" if source else ""
+            raise KeyError(f"Genomes{where} not found in the catalog: {', '.join(missing)}")
+        return ids
+
+    def list_ids(self, genomes_list, chunk_size=1 << 16):
+        # IDs of a genome list, looked up in chunks so its paths are never all held at once
+        ids = []
+        chunk = []
+        for p in read_paths(genomes_list):
+            chunk.append(genome_name(p))
+            if len(chunk) == chunk_size:
+                ids.append(self.ids(chunk, genomes_list))
+                chunk = []
+        ids.append(self.ids(chunk, genomes_list))
+        return np.concatenate(ids)
+
+def read_paths(genomes_list):
+    with open(genomes_list) as f:
+        for line in f:
+            if line.strip():
+                yield line.strip()
+
+def load_catalog(genomes):
+    # A saved catalog (.npz) or a list of genome paths
+    if genomes.endswith('.npz'):
+        return GenomeCatalog.load(genomes)
+    return GenomeCatalog.from_list(genomes)
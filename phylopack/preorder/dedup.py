@@ -0,0 +1,220 @@
+import argparse
+import os
+import time
+import json
+import csv
+import hashlib
+import resource
+from collections import defaultdict
+
+import numpy as np
+
+from phylopack.preorder.placement import mash_sketch
+from phylopack.preorder.sketch import load_sketch_hashes, mash_distance_from_hashes
+from phylopack.preorder.catalog import genome_name
+
+def add_dedup_args(parser):
+    parser.add_argument('input_genomes', help='Path to the input list of genomes')
+    parser.add_argument('-o', '--output', help='Output path (default: current folder)', default='.')
+    parser.add_argument('-d', '--distance', type=float, default=0.0, help='Collapse genomes at or below this Mash distance (default: 0.0)')
+    parser.add_argument('-k', type=int, default=21, help='K-mer size (default: 21)')
+    parser.add_argument('-s', type=int, default=1000, help='Sketch size (default: 1000)')
+    parser.add_argument('-t', type=int, default=10, help='Number of threads (default: 10)')
+    parser.add_argument('--lsh-bands', type=int, default=16, help='Number of LSH bands (default: 16)')
+    parser.add_argument('--lsh-rows', type=int, default=4, help='Min-hashes per LSH band (default: 4)')
+    parser.add_argument('-v','--verbose', action='store_true', help='Print logs')
+    parser.add_argument('--statistic', action='store_true', help='Output statistics file')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+    parser.add_argument('--rep-output', help='Custom output filename for representatives (overrides default)')
+    parser.add_argument('--dup-output', help='Custom output filename for duplicate groups (overrides default)')
+
+def lsh_buckets(hashes, names, bands, rows, seed=0):
+    # Re-permute each sketch with random affine maps (mod 2^64) and band the minima
+    rng = np.random.default_rng(seed)
+    mult = rng.integers(1, 2**63, size=bands * rows, dtype=np.uint64) | np.uint64(1)
+    add = rng.integers(0, 2**63, size=bands * rows, dtype=np.uint64)
+
+    buckets = defaultdict(list)
+    with np.errstate(over='ignore'):
+        for name in names:
+            h = hashes[name]
+            if len(h) == 0:
+                continue
+            mins = (h[None, :] * mult[:, None] + add[:, None]).min(axis=1)
+            for band in range(bands):
+                key = (band, mins[band * rows:(band + 1) * rows].tobytes())
+                buckets[key].append(name)
+
+    # Members stay in input order
+    return [members for members in buckets.values() if len(members) > 1]
+
+def run_dedup(args):
+
+    wall_start = time.time()
+    cpu_start = os.times()
+
+    input_basename = os.path.splitext(os.path.basename(args.input_genomes))[0]
+    rep_path = args.rep_output or os.path.join(args.output, f'representatives_{input_basename}.txt')
+    dup_path = args.dup_output or os.path.join(args.output, f'duplicates_{input_basename}.tsv')
+
+    with open(args.input_genomes) as f:
+        genomes = [line.strip() for line in f if line.strip()]
+
+    sketch, sketch_time = mash_sketch(args.input_genomes, args.output, args.k, args.s, args.t, args.verbose)
+    hashes = load_sketch_hashes(sketch)
+
+    missing = [g for g in genomes if g not in hashes]
+    if missing:
+        raise KeyError(f"Genomes missing from the sketch: {', '.join(missing)}")
+
+    dedup_start = time.time()
+
+    # Exact pass: identical sketches collapse onto the first genome in input order
+    assigned = {}
+    exact = {}
+    for g in genomes:
+        key = hashlib.sha1(hashes[g].tobytes()).digest()
+        if key in exact:
+            assigned[g] = exact[key]
+        else:
+            exact[key] = g
+    exact_duplicates = len(assigned)
+
+    # Near-identical pass: LSH candidates verified with the Mash distance estimate
+    lsh_pairs = 0
+    if args.distance > 0:
+        unique = [g for g in genomes if g not in assigned]
+        # Genomes that collapsed others stay representatives, so links never chain
+        kept = set()
+        verified = set()
+        for members in lsh_buckets(hashes, unique, args.lsh_bands, args.lsh_rows):
+            # Verify each bucket against its first unassigned member only: linear in the bucket size
+            rep = next((g for g in members if g not in assigned), None)
+            if rep is None:
+                continue
+            for other in members:
+                if other == rep or other in assigned or other in kept or (rep, other) in verified:
+                    continue
+                verified.add((rep, other))
+                lsh_pairs += 1
+                if mash_distance_from_hashes(hashes[rep], hashes[other], args.k, args.s) <= args.distance:
+                    assigned[other] = rep
+                    kept.add(rep)
+
+    groups = defaultdict(list)
+    for g in genomes:
+        if g in assigned:
+            # Follow exact-duplicate links to the final representative
+            rep = assigned[g]
+            while rep in assigned:
+                rep = assigned[rep]
+            groups[rep].append(g)
+
+    representatives = [g for g in genomes if g not in assigned]
+
+    with open(rep_path, 'w') as f:
+        for g in representatives:
+            f.write(g + '\n')
+
+    with open(dup_path, 'w') as f:
+        for rep in representatives:
+            if groups[rep]:
+                f.write('\t'.join([genome_name(rep)] + [genome_name(g) for g in groups[rep]]) + '\n')
+
+    wall_end = time.time()
+    cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    if args.verbose:
+        print(f'[INFO] Collapsed {len(genomes)} genomes into {len(representatives)} representatives')
+        print(f'[INFO] Deduplication elapsed time: {round(wall_end - wall_start, 4)}s')
+
+    stats = {
+        "parameters": {
+            "input": os.path.abspath(args.input_genomes),
+            "output": os.path.abspath(args.output),
+            "distance": args.distance,
+            "k": args.k,
+            "sketch_size": args.s,
+            "lsh_bands": args.lsh_bands,
+            "lsh_rows": args.lsh_rows,
+            "genome_count": len(genomes),
+            "representative_count": len(representatives),
+            "exact_duplicate_count": exact_duplicates,
+            "near_duplicate_count": len(assigned) - exact_duplicates,
+            "verified_pairs": lsh_pairs
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(wall_end - wall_start, 4),
+                "user_time": round(cpu_end.user - cpu_start.user, 4),
+                "system_time": round(cpu_end.system - cpu_start.system, 4)
+            },
+            "sketch": sketch_time,
+            "grouping": {
+                "wall_time": round(wall_end - dedup_start, 4)
+            }
+        },
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.statistic:
+        stats_path = os.path.join(args.output, f"dedup_stats.{args.statistic_file_type}")
+        if args.statistic_file_type == 'json':
+            with open(stats_path, 'w') as f:
+                json.dump(stats, f, indent=2)
+        else:  # CSV
+            with open(stats_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Category', 'Key', 'Value'])
+                for k, v in stats['parameters'].items():
+                    writer.writerow(['parameter', k, v])
+                for k, v in stats['timings'].items():
+                    for sub_k, sub_v in v.items():
+                        writer.writerow(['timing', f"{k}.{sub_k}", sub_v])
+                for k, v in stats['resources'].items():
+                    writer.writerow(['resource', k, v])
+        if args.verbose:
+            print(f"[INFO] Statistics saved to: {stats_path}")
+
+def load_duplicates(dup_path):
+    duplicates = {}
+    with open(dup_path) as f:
+        for line in f:
+            fields = [x for x in line.rstrip('\n').split('\t') if x]
+            if fields:
+                duplicates[fields[0]] = fields[1:]
+    return duplicates
+
+def expand_duplicates(path, duplicates):
+    # Re-insert duplicates right after their representative, in place
+    with open(path) as f:
+        lines = [line.rstrip('\n') for line in f]
+    with open(path, 'w') as f:
+        for line in lines:
+            fields = line.split('\t')
+            expanded = []
+            for x in fields:
+                expanded.append(x)
+                expanded.extend(duplicates.get(x, []))
+            # Lists hold one genome per line, group tables one group per line
+            sep = '\t' if '\t' in line else '\n'
+            f.write(sep.join(expanded) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Collapse genomes with identical or near-identical sketches onto one representative'
+    )
+    add_dedup_args(parser)
+    args = parser.parse_args()
+    run_dedup(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import fcntl
+import tempfile
+
+import numpy as np
+
+BLOCK_SIZE_DEFAULT = 1024
+
+class DistanceStore:
+    # On-disk reference-pair distances for one (k, sketch size): genome names get dense
+    # integer IDs, pairs (i < j) live in float32 blocks of block_size x block_size, NaN when unknown
+    def __init__(self, root, k, s, block_size=BLOCK_SIZE_DEFAULT):
+        self.path = os.path.join(root, f"k{k}_s{s}")
+        os.makedirs(self.path, exist_ok=True)
+        # Runs sharing the store are serialized: the lock is held from loading to saving,
+        # so IDs and blocks always extend what the previous run wrote
+        self.lock_file = open(os.path.join(self.path, "store.lock"), 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        self.block_size = block_size
+        self.blocks = {}
+        self.dirty = set()
+
+        self.names = []
+        self.name_ids = {}
+        self.genomes_file = os.path.join(self.path, "genomes.txt")
+        if os.path.exists(self.genomes_file):
+            with open(self.genomes_file) as f:
+                for line in f:
+                    self.name_ids[line.strip()] = len(self.names)
+                    self.names.append(line.strip())
+        self.n_saved = len(self.names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self.lock_file.closed:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+
+    def ids(self, names):
+        ids = []
+        for name in names:
+            if name not in self.name_ids:
+                self.name_ids[name] = len(self.names)
+                self.names.append(name)
+            ids.append(self.name_ids[name])
+        return np.array(ids, dtype=np.int64)
+
+    def block(self, bi, bj):
+        key = (bi, bj)
+        if key not in self.blocks:
+            fn = os.path.join(self.path, f"block_{bi}_{bj}.npy")
+            if os.path.exists(fn):
+                self.blocks[key] = np.load(fn)
+            else:
+                self.blocks[key] = np.full((self.block_size, self.block_size), np.nan, dtype=np.float32)
+        return self.blocks[key]
+
+    def matrix(self, ids):
+        n = len(ids)
+        matrix = np.full((n, n), np.nan, dtype=np.float32)
+        np.fill_diagonal(matrix, 0.0)
+        block_of = ids // self.block_size
+        members = {b: np.flatnonzero(block_of == b) for b in np.unique(block_of)}
+        for bi, rows in members.items():
+            for bj, cols in members.items():
+                if bi > bj:
+                    continue
+                fn = os.path.join(self.path, f"block_{bi}_{bj}.npy")
+                if (bi, bj) not in self.blocks and not os.path.exists(fn):
+                    continue
+                sub = self.block(bi, bj)[np.ix_(ids[rows] % self.block_size, ids[cols] % self.block_size)]
+                # Only entries stored with row ID < column ID are meaningful
+                upper = ids[rows][:, None] < ids[cols][None, :]
+                r, c = np.nonzero(upper)
+                matrix[rows[r], cols[c]] = sub[r, c]
+                matrix[cols[c], rows[r]] = sub[r, c]
+        return matrix
+
+    def put(self, ids_a, ids_b, values):
+        i = np.minimum(ids_a, ids_b)
+        j = np.maximum(ids_a, ids_b)
+        keep = i != j
+        i, j, values = i[keep], j[keep], np.asarray(values, dtype=np.float32)[keep]
+        bi, bj = i // self.block_size, j // self.block_size
+        for key in set(zip(bi.tolist(), bj.tolist())):
+            sel = (bi == key[0]) & (bj == key[1])
+            self.block(*key)[i[sel] % self.block_size, j[sel] % self.block_size] = values[sel]
+            self.dirty.add(key)
+
+    def replace(self, path, write):
+        # Write next to the target and rename over it, readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def save(self):
+        # Genome IDs first: after a crash, registered genomes only lack distances
+        if len(self.names) > self.n_saved:
+            self.replace(self.genomes_file, lambda f: f.write(''.join(name + '\n' for name in self.names).encode()))
+            self.n_saved = len(self.names)
+        for bi, bj in self.dirty:
+            block = self.blocks[(bi, bj)]
+            self.replace(os.path.join(self.path, f"block_{bi}_{bj}.npy"), lambda f: np.save(f, block))
+        self.dirty.clear()
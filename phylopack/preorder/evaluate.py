@@ -0,0 +1,181 @@
+import argparse
+import os
+import time
+import json
+import csv
+import resource
+
+import numpy as np
+
+from phylopack.preorder.placement import mash_sketch
+from phylopack.preorder.sketch import PAD, load_sketch_hashes, hash_matrix, adjacent_distances
+from phylopack.preorder.catalog import genome_name
+from phylopack.batch.pack import read_preorder
+
+def add_evaluate_parser(subparsers):
+    evaluate_parser = subparsers.add_parser("evaluate", help="Score a preorder from sketches, without compressing")
+    add_evaluate_args(evaluate_parser)
+    evaluate_parser.set_defaults(func=run_evaluate)
+
+def add_evaluate_args(parser):
+    parser.add_argument('preorder', help='Path to the genome preorder (e.g. placement_order.txt)')
+    parser.add_argument('input_genomes', help='Input list of genomes or genome catalog (genome_catalog.npz), used to resolve genome files')
+    parser.add_argument('-o', '--output', help='Output folder (default: current folder)', default='.')
+    parser.add_argument('--sketch', help='Existing Mash sketch (.msh) of the genomes, sketched otherwise')
+    parser.add_argument('-k', type=int, default=21, help='K-mer size (default: 21)')
+    parser.add_argument('-s', type=int, default=1000, help='Sketch size (default: 1000)')
+    parser.add_argument('-t', type=int, default=10, help='Number of threads (default: 10)')
+    parser.add_argument('-w', '--window', type=int, default=8, help='Number of preceding genomes in the sliding window (default: 8)')
+    parser.add_argument('--batch-size', type=int, default=4096, help='Genome pairs scored per vectorized batch (default: 4096)')
+    parser.add_argument('--per-position', action='store_true', help='Also write per-genome scores (evaluate_positions.tsv)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+    parser.add_argument(
+        '--statistic-file-type',
+        choices=['json', 'csv'],
+        default='json',
+        help='Output statistics format: json or csv (default: json)'
+    )
+
+def window_shared(matrix, window, batch_size):
+    # Sketch hashes of each genome already present in one of the `window` preceding genomes
+    n, s = matrix.shape
+    shared = np.zeros(n, dtype=np.int64)
+    for start in range(1, n, batch_size):
+        end = min(n, start + batch_size)
+        current = matrix[start:end]
+        seen = np.zeros(current.shape, dtype=bool)
+        for offset in range(1, window + 1):
+            lo = max(start, offset)
+            if lo >= end:
+                break
+            rows = slice(lo - start, end - start)
+            merged = np.concatenate([matrix[lo:end], matrix[lo - offset:end - offset]], axis=1)
+            order = np.argsort(merged, axis=1, kind='stable')
+            values = np.take_along_axis(merged, order, axis=1)
+            dup = (values[:, 1:] == values[:, :-1]) & (values[:, 1:] != PAD)
+            r, c = np.nonzero(dup)
+            # Each row is duplicate-free, so the earlier element of a pair belongs to the current genome
+            seen[rows][r, order[r, c]] = True
+        shared[start:end] = seen.sum(axis=1)
+    return shared
+
+def describe(values):
+    if len(values) == 0:
+        return {}
+    return {
+        "sum": round(float(values.sum()), 6),
+        "mean": round(float(values.mean()), 6),
+        "median": round(float(np.median(values)), 6),
+        "p90": round(float(np.percentile(values, 90)), 6),
+        "p99": round(float(np.percentile(values, 99)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+def run_evaluate(args):
+
+    wall_start = time.time()
+    cpu_start = os.times()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    paths = read_preorder(args.preorder, args.input_genomes)
+
+    sketch_start = time.time()
+    if args.sketch:
+        sketch = args.sketch[:-len('.msh')] if args.sketch.endswith('.msh') else args.sketch
+    else:
+        list_path = os.path.join(args.output, "evaluate_genomes.txt")
+        with open(list_path, 'w') as f:
+            for p in paths:
+                f.write(p + '\n')
+        sketch, _ = mash_sketch(list_path, args.output, args.k, args.s, args.t, args.verbose)
+    by_path = load_sketch_hashes(sketch)
+    missing = [p for p in paths if p not in by_path]
+    if missing:
+        raise KeyError(f"Genomes missing from the sketch: {', '.join(missing)}")
+    matrix = hash_matrix([by_path[p] for p in paths], args.s)
+    sketch_time = time.time() - sketch_start
+
+    score_start = time.time()
+    distances = adjacent_distances(matrix, args.k, args.s, args.batch_size)
+    shared = window_shared(matrix, args.window, args.batch_size)
+    score_time = time.time() - score_start
+
+    sizes = (matrix != PAD).sum(axis=1)
+    novel = 1.0 - shared / np.maximum(sizes, 1)
+
+    if args.per_position:
+        with open(os.path.join(args.output, "evaluate_positions.tsv"), 'w') as f:
+            f.write("genome\tadjacent_distance\twindow_shared_kmers\tnovel_fraction\n")
+            for i, p in enumerate(paths):
+                d = distances[i - 1] if i > 0 else ''
+                f.write(f"{genome_name(p)}\t{d}\t{shared[i]}\t{round(float(novel[i]), 6)}\n")
+
+    wall_end = time.time()
+    cpu_end = os.times()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    stats = {
+        "parameters": {
+            "preorder": args.preorder,
+            "input_genomes": args.input_genomes,
+            "output": args.output,
+            "k": args.k,
+            "sketch_size": args.s,
+            "window": args.window,
+            "genome_count": len(paths),
+        },
+        "metrics": {
+            "adjacent_distance": describe(distances),
+            "window_shared_kmers": describe(shared[1:].astype(np.float64)),
+            "novel_fraction": describe(novel[1:]),
+        },
+        "timings": {
+            "total": {
+                "wall_time": round(wall_end - wall_start, 4),
+                "user_time": round(cpu_end.user - cpu_start.user, 4),
+                "system_time": round(cpu_end.system - cpu_start.system, 4)
+            },
+            "sketch": {"wall_time": round(sketch_time, 4)},
+            "scoring": {"wall_time": round(score_time, 4)}
+        },
+        "resources": {
+            "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
+        }
+    }
+
+    if args.verbose:
+        print(f"[INFO] Sum of adjacent distances: {stats['metrics']['adjacent_distance'].get('sum')}")
+        print(f'[INFO] Evaluation elapsed time: {round(wall_end - wall_start, 4)}s')
+
+    stats_path = os.path.join(args.output, f"evaluate_stats.{args.statistic_file_type}")
+    if args.statistic_file_type == 'json':
+        with open(stats_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+    elif args.statistic_file_type == 'csv':
+        with open(stats_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Category', 'Key', 'Value'])
+            for k, v in stats['parameters'].items():
+                writer.writerow(['parameter', k, v])
+            for k, v in stats['metrics'].items():
+                for sub_k, sub_v in v.items():
+                    writer.writerow(['metric', f"{k}.{sub_k}", sub_v])
+            for k, v in stats['timings'].items():
+                for sub_k, sub_v in v.items():
+                    writer.writerow(['timing', f"{k}.{sub_k}", sub_v])
+            for k, v in stats['resources'].items():
+                writer.writerow(['resource', k, v])
+    if args.verbose:
+        print(f"[INFO] Statistics saved to: {stats_path}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score a genome preorder from sketches: adjacent Mash distances and windowed shared k-mers'
+    )
+    add_evaluate_args(parser)
+    args = parser.parse_args()
+    run_evaluate(args)
+
+if __name__ == "__main__":
+    main()
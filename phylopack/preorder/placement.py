@@ -2,12 +2,17 @@ import argparse
 import os
 import time
 import json
+import io
 import subprocess
 from datetime import datetime
-from collections import defaultdict
 import resource
 import csv
 
+import numpy as np
+
+from phylopack.preorder.sketch import load_sketch_hashes, hash_matrix, pair_distances
+from phylopack.preorder.catalog import GenomeCatalog, genome_name, load_catalog
+
 SEED_DEFAULT = int(datetime.now().timestamp())
 
 def add_placement_args(parser):
@@ -20,6 +25,17 @@ def add_placement_args(parser):
     parser.add_argument('-t', type=int, default=10, help='Number of threads (default: 10)')
     parser.add_argument('--statistic', action='store_true', help='Output json statistics file')
     parser.add_argument('--exclude-skeleton', action='store_true', help='Exclude the skeleton genomes')
+    parser.add_argument(
+        '--outlier-distance', type=float, default=1.0,
+        help='Queries whose nearest reference is at or beyond this distance are placed last as outliers (default: 1.0)'
+    )
+    parser.add_argument('--max-group-size', type=int, help='Split placement groups larger than this into sub-groups by second nearest reference')
+    parser.add_argument('--catalog', help='Genome catalog (genome_catalog.npz) or genome list covering both lists (default: built from them)')
+    parser.add_argument('--cascade', action='store_true', help='Screen references with a small sketch, re-rank the top candidates with the full sketch')
+    parser.add_argument('--screen-k', type=int, help='K-mer size of the screening sketch (default: same as -k)')
+    parser.add_argument('--screen-sketch', type=int, default=128, help='Sketch size of the screening sketch (default: 128)')
+    parser.add_argument('--screen-top', type=int, default=10, help='Candidate references kept per query after screening (default: 10)')
+    parser.add_argument('--cascade-recall', action='store_true', help='Also run exhaustive placement and report the recall of the cascade')
     parser.add_argument(
         '--statistic-file-type',
         choices=['json', 'csv'],
@@ -94,7 +110,60 @@ def mash_distance(sketch_1, sketch_2, t, output_path, verbose=False):
         'system_time': cpu_end.system - cpu_start.system
     }
 
-def argmin(distance_file, rows, cols, verbose = False):
+def nearest_references(distance_file):
+    # Nearest reference, its distance and the second nearest reference per query
+    awk_script = (
+        'BEGIN { FS="\\t" } '
+        'NR > 1 { '
+        'min = $2; idx = 0; min2 = 2; idx2 = -1; '
+        'for (i = 3; i <= NF; i++) { '
+        'if ($i < min) { min2 = min; idx2 = idx; min = $i; idx = i - 2; } '
+        'else if ($i < min2) { min2 = $i; idx2 = i - 2; } '
+        '} print idx "\\t" min "\\t" idx2; }'
+    )
+
+    result = subprocess.run(
+        ["awk", awk_script],
+        stdin=open(distance_file),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    table = np.loadtxt(io.StringIO(result.stdout), delimiter='\t', ndmin=2).reshape(-1, 3)
+    return table[:, 0].astype(np.int64), table[:, 1], table[:, 2].astype(np.int64)
+
+def group_placements(nearest, n_cols, outlier_distance=None, max_group_size=None):
+    # Query row indices sorted by group (reference column), with per-column offsets
+    idx, dist, idx2 = nearest
+
+    # Queries sharing no hashes with any reference all tie at distance 1 on column 0
+    if outlier_distance is not None:
+        outlier = dist >= outlier_distance
+    else:
+        outlier = np.zeros(len(idx), dtype=bool)
+    order = np.flatnonzero(~outlier)
+    order = order[np.argsort(idx[order], kind='stable')]
+    offsets = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(idx[order], minlength=n_cols), out=offsets[1:])
+
+    # Split over-full groups into sub-groups by second nearest reference (in skeleton order),
+    # ordered by distance within; breaks holds the positions in order where sub-groups start
+    oversized = 0
+    breaks = []
+    if max_group_size is not None:
+        for col in np.flatnonzero(np.diff(offsets) > max_group_size):
+            members = order[offsets[col]:offsets[col + 1]]
+            second = np.where(idx2[members] >= 0, idx2[members], idx[members])
+            sub_order = np.lexsort((dist[members], second))
+            order[offsets[col]:offsets[col + 1]] = members[sub_order]
+            breaks.append(offsets[col] + 1 + np.flatnonzero(np.diff(second[sub_order])))
+            oversized += 1
+    breaks = np.concatenate(breaks) if breaks else np.array([], dtype=np.int64)
+
+    return order, offsets, breaks, np.flatnonzero(outlier), oversized
+
+def argmin(distance_file, rows, cols, outlier_distance=None, max_group_size=None, verbose = False):
 
     if verbose:
         print(f"[INFO] Finding argmin from distance file: {distance_file}")
@@ -102,40 +171,130 @@ def argmin(distance_file, rows, cols, verbose = False):
     start = time.time()
     cpu_start = os.times()
 
+    nearest = nearest_references(distance_file)
+    order, offsets, _, outliers, oversized = group_placements(nearest, len(cols), outlier_distance, max_group_size)
+    groups = {
+        col: [rows[r] for r in order[offsets[c]:offsets[c + 1]]]
+        for c, col in enumerate(cols) if offsets[c + 1] > offsets[c]
+    }
+    outliers = [rows[r] for r in outliers]
+
+    end = time.time()
+    cpu_end = os.times()
+
+    return groups, outliers, oversized, {
+        'wall_time': end - start,
+        'user_time': cpu_end.user - cpu_start.user,
+        'system_time': cpu_end.system - cpu_start.system
+    }
+
+def nearest_candidates(distance_file, top):
+    # Column indices of the top closest references per query, kept while streaming the table
     awk_script = (
         'BEGIN { FS="\\t" } '
-        'NR > 1 { '
-        'min = $2; idx = 0; '
-        'for (i = 3; i <= NF; i++) { '
-        'if ($i < min) { min = $i; idx = i - 2; } '
-        '} print idx; }'
+        'NR > 1 { n = 0; '
+        'for (i = 2; i <= NF; i++) { '
+        'd = $i + 0; '
+        'if (n < top) { j = n; n++; } else if (d < best[n - 1]) { j = n - 1; } else { continue; } '
+        'while (j > 0 && best[j - 1] > d) { best[j] = best[j - 1]; idx[j] = idx[j - 1]; j--; } '
+        'best[j] = d; idx[j] = i - 2; '
+        '} line = idx[0]; for (j = 1; j < n; j++) { line = line "\\t" idx[j]; } print line; }'
     )
 
     result = subprocess.run(
-        ["awk", awk_script],
+        ["awk", "-v", f"top={top}", awk_script],
         stdin=open(distance_file),
         capture_output=True,
         text=True,
         check=True
     )
 
-    argmin_indices = [int(i) for i in result.stdout.strip().split("\n")]
+    return np.loadtxt(io.StringIO(result.stdout), delimiter='\t', dtype=np.int64, ndmin=2).reshape(-1, top)
 
-    groups = defaultdict(list)
+def cascade_nearest(args, sketch_1, sketch_2, catalog, row_ids, col_ids, batch_size=4096):
+    timings = {}
+
+    # Screen: every query against every reference with the small sketch
+    screen_dir = os.path.join(args.output, "screen")
+    os.makedirs(screen_dir, exist_ok=True)
+    screen_k = args.screen_k or args.k
+    screen_1, timings['screen_sketch_list_1'] = mash_sketch(args.genomes_list_1, screen_dir, screen_k, args.screen_sketch, args.t, args.verbose)
+    screen_2, timings['screen_sketch_list_2'] = mash_sketch(args.genomes_list_2, screen_dir, screen_k, args.screen_sketch, args.t, args.verbose)
+    screen_file, timings['screen_distance'] = mash_distance(screen_1, screen_2, args.t, screen_dir, args.verbose)
+
+    start = time.time()
+    cpu_start = os.times()
 
-    for row_name, idx in zip(rows, argmin_indices):
-        col_name = cols[idx]
-        groups[col_name].append(row_name)
+    top = min(args.screen_top, len(col_ids))
+    candidates = nearest_candidates(screen_file, top)
+    # Column order among candidates, so ties resolve to the first reference like the exhaustive argmin
+    candidates.sort(axis=1)
+
+    # Re-rank: full-size sketch distances for the candidate pairs only
+    query_hashes = {genome_name(p): h for p, h in load_sketch_hashes(sketch_1).items()}
+    reference_hashes = {genome_name(p): h for p, h in load_sketch_hashes(sketch_2).items()}
+    queries = hash_matrix([query_hashes[catalog.name(i)] for i in row_ids], args.s)
+    references = hash_matrix([reference_hashes[catalog.name(i)] for i in col_ids], args.s)
+
+    distances = np.empty(candidates.shape, dtype=np.float64)
+    chunk = max(1, batch_size // top)
+    for lo in range(0, len(queries), chunk):
+        hi = min(len(queries), lo + chunk)
+        rows = np.repeat(np.arange(lo, hi), top)
+        distances[lo:hi] = pair_distances(
+            queries[rows], references[candidates[lo:hi].ravel()], args.k, args.s, batch_size
+        ).reshape(hi - lo, top)
+
+    order = np.argsort(distances, axis=1, kind='stable')
+    best = np.take_along_axis(candidates, order[:, :1], axis=1)[:, 0]
+    best_dist = np.take_along_axis(distances, order[:, :1], axis=1)[:, 0]
+    if top > 1:
+        runner_up = np.take_along_axis(candidates, order[:, 1:2], axis=1)[:, 0]
+    else:
+        runner_up = np.full(len(best), -1)
+    nearest = (best, best_dist, runner_up)
 
     end = time.time()
     cpu_end = os.times()
-
-    return groups, {
+    timings['rerank'] = {
         'wall_time': end - start,
         'user_time': cpu_end.user - cpu_start.user,
         'system_time': cpu_end.system - cpu_start.system
     }
 
+    stats = {
+        "screen_k": screen_k,
+        "screen_sketch_size": args.screen_sketch,
+        "screen_top": top,
+        "reranked_pairs": int(candidates.size),
+        "exhaustive_pairs": len(row_ids) * len(col_ids),
+    }
+
+    if args.cascade_recall:
+        distance_file, timings['exhaustive_distance'] = mash_distance(sketch_1, sketch_2, args.t, args.output, args.verbose)
+        exhaustive = nearest_references(distance_file)
+        # A query is recalled when the cascade finds a reference as close as the exhaustive nearest
+        if len(best):
+            stats["recall"] = round(float(np.mean(best_dist <= exhaustive[1] + 1e-6)), 6)
+            stats["same_reference"] = round(float(np.mean(best == exhaustive[0])), 6)
+        else:
+            stats["recall"] = stats["same_reference"] = None
+
+    return nearest, stats, timings
+
+def group_size_histogram(sizes):
+    # Power-of-two buckets: 0, 1, 2-3, 4-7, ...
+    histogram = {}
+    for size in sizes.tolist():
+        if size == 0:
+            bucket = "0"
+        else:
+            low = 1 << (size.bit_length() - 1)
+            high = 2 * low - 1
+            bucket = str(low) if low == high else f"{low}-{high}"
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    return dict(sorted(histogram.items(), key=lambda kv: int(kv[0].split('-')[0])))
+
 def run_placement(args):
 
     full_start = time.time()
@@ -146,31 +305,89 @@ def run_placement(args):
     sketch_1, sketch_time_1 = mash_sketch(args.genomes_list_1, args.output, args.k, args.s, args.t, args.verbose)
     sketch_2, sketch_time_2 = mash_sketch(args.genomes_list_2, args.output, args.k, args.s, args.t, args.verbose)
 
-    ### Calculating distances
+    # Queries and references are handled as catalog IDs, names are only looked up for writing
+    if args.catalog:
+        catalog = load_catalog(args.catalog)
+    else:
+        catalog = GenomeCatalog.from_list(args.genomes_list_1, args.genomes_list_2)
+    row_ids = catalog.list_ids(args.genomes_list_1)
+    col_ids = catalog.list_ids(args.genomes_list_2)
 
-    distance_file, dis_time = mash_distance(sketch_1, sketch_2, args.t, args.output, args.verbose)
+    cascade_stats = None
+    if args.cascade:
 
-    ### Grouping and writing to output
+        ### Screening and re-ranking
 
-    with open(args.genomes_list_1) as f:
-        row_names = ['.'.join(os.path.basename(line.strip()).split('.')[:-1]) for line in f]    
-    
-    with open(args.genomes_list_2) as f:
-        col_names = ['.'.join(os.path.basename(line.strip()).split('.')[:-1]) for line in f]    
+        nearest, cascade_stats, cascade_time = cascade_nearest(args, sketch_1, sketch_2, catalog, row_ids, col_ids)
 
+        if args.verbose:
+            print(f"[INFO] Cascade re-ranked {cascade_stats['reranked_pairs']} of {cascade_stats['exhaustive_pairs']} pairs")
+            if 'recall' in cascade_stats:
+                print(f"[INFO] Cascade recall against exhaustive placement: {cascade_stats['recall']}")
+    else:
+
+        ### Calculating distances
 
-    argmin_result, grouping_time = argmin(distance_file, row_names, col_names, args.verbose)
+        distance_file, dis_time = mash_distance(sketch_1, sketch_2, args.t, args.output, args.verbose)
+
+    ### Grouping
+
+    if args.verbose and not args.cascade:
+        print(f"[INFO] Finding argmin from distance file: {distance_file}")
+
+    grouping_start = time.time()
+    grouping_cpu_start = os.times()
+    if not args.cascade:
+        nearest = nearest_references(distance_file)
+    order, offsets, breaks, outliers, oversized = group_placements(
+        nearest, len(col_ids), args.outlier_distance, args.max_group_size
+    )
+    grouping_cpu_end = os.times()
+    grouping_time = {
+        'wall_time': time.time() - grouping_start,
+        'user_time': grouping_cpu_end.user - grouping_cpu_start.user,
+        'system_time': grouping_cpu_end.system - grouping_cpu_start.system
+    }
+
+    if args.verbose and len(outliers):
+        print(f"[INFO] {len(outliers)} outlier queries at distance >= {args.outlier_distance}")
 
     preorder_file = os.path.join(args.output, f"placement_order.txt")
     # Preorder writing
     if args.verbose:
         print(f"[INFO] Writing preorder result to file")
     with open(preorder_file, 'w') as preorder_file:
-        for col in col_names:
+        for c, col in enumerate(col_ids):
             if not args.exclude_skeleton:
-                preorder_file.write(col + '\n')
-            for val in argmin_result[col]:
-                preorder_file.write(val + '\n')
+                preorder_file.write(catalog.name(col) + '\n')
+            for r in order[offsets[c]:offsets[c + 1]]:
+                preorder_file.write(catalog.name(row_ids[r]) + '\n')
+        for r in outliers:
+            preorder_file.write(catalog.name(row_ids[r]) + '\n')
+
+    outliers_file = os.path.join(args.output, f"outliers.txt")
+    with open(outliers_file, 'w') as f:
+        for r in outliers:
+            f.write(catalog.name(row_ids[r]) + '\n')
+
+    # Placement groups per skeleton leaf, used to plan clade-aware batches
+    placement_groups = os.path.join(args.output, f"skeleton_tree.tsv")
+
+    # Sub-groups of a split group are separated by an empty field
+    is_break = np.zeros(len(order), dtype=bool)
+    is_break[breaks] = True
+
+    with open(placement_groups, 'w') as ske_tree:
+        for c, col in enumerate(col_ids):
+            ske_tree.write(catalog.name(col) + '\t')
+            for pos in range(offsets[c], offsets[c + 1]):
+                if is_break[pos]:
+                    ske_tree.write('\t')
+                ske_tree.write(catalog.name(row_ids[order[pos]]) + '\t')
+            ske_tree.write('\n')
+
+    # Split groups count as their sub-groups
+    group_sizes = np.diff(np.sort(np.concatenate([offsets, breaks])))
 
     full_end = time.time()
     full_cpu_end = os.times()
@@ -185,6 +402,17 @@ def run_placement(args):
             "k": args.k,
             "sketch_size": args.s,
             "threads": args.t,
+            "outlier_distance": args.outlier_distance,
+            "max_group_size": args.max_group_size,
+            "cascade": args.cascade,
+            "catalog": args.catalog,
+        },
+        "groups": {
+            "outliers": len(outliers),
+            "oversized_groups": oversized,
+            "subgroups": oversized + len(breaks),
+            "max_group_size": int(group_sizes.max(initial=0)),
+            "group_size_histogram": group_size_histogram(group_sizes),
         },
         "timings": {},
         "resources": {"max_rss_MB": round(usage.ru_maxrss / 1000, 2)}
@@ -192,7 +420,11 @@ def run_placement(args):
 
     stats["timings"]['sketch_list_1'] = sketch_time_1
     stats["timings"]['sketch_list_2'] = sketch_time_2
-    stats["timings"]['mash_distance'] = dis_time
+    if cascade_stats is not None:
+        stats["cascade"] = cascade_stats
+        stats["timings"].update(cascade_time)
+    else:
+        stats["timings"]['mash_distance'] = dis_time
     stats["timings"]['grouping'] = grouping_time
     stats["timings"]['total'] = {
         'wall_time': full_end - full_start,
@@ -217,6 +449,16 @@ def run_placement(args):
                 for k, v in stats["parameters"].items():
                     writer.writerow(["parameter", k, v])
 
+                for k, v in stats["groups"].items():
+                    if isinstance(v, dict):
+                        for sub_k, sub_v in v.items():
+                            writer.writerow(["group", f"{k}.{sub_k}", sub_v])
+                    else:
+                        writer.writerow(["group", k, v])
+
+                for k, v in stats.get("cascade", {}).items():
+                    writer.writerow(["cascade", k, v])
+
                 for k, v in stats["timings"].items():
                     for sub_k, sub_v in v.items():
                         writer.writerow(["timing", f"{k}.{sub_k}", sub_v])
@@ -224,15 +466,6 @@ def run_placement(args):
                 for k, v in stats["resources"].items():
                     writer.writerow(["resource", k, v])
 
-        placement_groups = os.path.join(args.output, f"skeleton_tree.tsv")
-
-        with open(placement_groups, 'w') as ske_tree:
-            for col in col_names:
-                ske_tree.write(col + '\t')
-                for val in argmin_result[col]:
-                    ske_tree.write(val + '\t')
-                ske_tree.write('\n')
-              
         if args.verbose:
             print(f"[INFO] Statistics saved to: {stats_path}")      
 
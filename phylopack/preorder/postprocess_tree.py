@@ -18,7 +18,6 @@ def name_internal_nodes(tree):
     re_inferred = re.compile(r'^(.*)-up(\d+)$')
 
     for n in tree.traverse("postorder"):
-        n.name = n.name.split('.')[0]
         if len(n.children) == 0:
             assert hasattr(n, "name")
         else:
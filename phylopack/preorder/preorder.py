@@ -4,11 +4,15 @@ import os
 import shutil
 import json
 import csv
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 from phylopack.preorder.split_cluster import run_split
 from phylopack.preorder.py_attotree import run_attotree
 from phylopack.preorder.placement import run_placement
+from phylopack.preorder.dedup import run_dedup, load_duplicates, expand_duplicates
+from phylopack.preorder.catalog import CATALOG_FILE, GenomeCatalog, genome_name
 
 def add_preorder_parser(subparsers):
     preorder_parser = subparsers.add_parser("preorder", help="Run full pipeline")
@@ -29,6 +33,17 @@ def _add_common_args(parser):
     parser.add_argument("-s-placement", type=int, default=1000, help="Sketch size placement(default: 1000)")
     parser.add_argument("-t", type=int, default=10, help="Threads (default: 10)")
     parser.add_argument("-m", choices=["nj", "upgma"], default="nj", help="Tree method (default: nj)")
+    parser.add_argument(
+        "--tree-mode", choices=["monolithic", "dc"], default="monolithic",
+        help="Skeleton tree construction: monolithic or divide-and-conquer (default: monolithic)"
+    )
+    parser.add_argument("--dc-clusters", type=int, help="Number of clusters in dc mode (default: square root of the skeleton size)")
+    parser.add_argument("--dc-max-cluster", type=int, help="Re-split clusters larger than this in dc mode (default: twice the mean cluster size)")
+    parser.add_argument("--dc-compare", action="store_true", help="In dc mode, also build the monolithic tree and compare")
+    parser.add_argument(
+        "--distance-store",
+        help="Directory of pairwise reference distances reused across runs, only missing pairs are computed (monolithic mode only, rejected with --tree-mode dc)"
+    )
     parser.add_argument("--statistic", action="store_true", help="Enable statistics")
     parser.add_argument(
         "--statistic-file-type", choices=["json", "csv"], default="csv",
@@ -40,6 +55,27 @@ def _add_common_args(parser):
     parser.add_argument('--nth', type=int, help = 'Select every nth genomes, sorted by accession number')
     parser.add_argument('--custom-ref', help='Path to the custom list of genomes as reference, required path to genome files')
     parser.add_argument('--exclude-skeleton', action='store_true', help='Exclude the skeleton genomes')
+    parser.add_argument(
+        '--outlier-distance', type=float, default=1.0,
+        help='Queries whose nearest reference is at or beyond this distance are placed last as outliers (default: 1.0)'
+    )
+    parser.add_argument('--max-group-size', type=int, help='Split placement groups larger than this into sub-groups by second nearest reference')
+    parser.add_argument('--cascade', action='store_true', help='Place with a small screening sketch first, re-ranking the top candidates at -s-placement')
+    parser.add_argument('--screen-k', type=int, help='K-mer size of the screening sketch (default: same as -k)')
+    parser.add_argument('--screen-sketch', type=int, default=128, help='Sketch size of the screening sketch (default: 128)')
+    parser.add_argument('--screen-top', type=int, default=10, help='Candidate references kept per query after screening (default: 10)')
+    parser.add_argument('--cascade-recall', action='store_true', help='Also run exhaustive placement and report the recall of the cascade')
+    parser.add_argument(
+        '--dedup-distance', type=float,
+        help='Collapse genomes at or below this Mash distance onto one representative before splitting (default: disabled)'
+    )
+    parser.add_argument('--lsh-bands', type=int, default=16, help='Number of LSH bands for deduplication (default: 16)')
+    parser.add_argument('--lsh-rows', type=int, default=4, help='Min-hashes per LSH band for deduplication (default: 4)')
+    parser.add_argument(
+        '--recursive-threshold', type=int,
+        help='Give placement groups larger than this their own split, skeleton tree and placement (default: disabled)'
+    )
+    parser.add_argument('--recursive-depth', type=int, default=1, help='Maximum number of recursive levels (default: 1)')
 
     parser.set_defaults(func=run_preorder_pipeline)
 
@@ -66,27 +102,16 @@ def concat_stat_files(paths, output_path, file_type="json"):
                     for row in reader:
                         writer.writerow([name] + row)
 
-def run_preorder_pipeline(args):
-    if args.debug:
-        tmpdir = os.path.join(os.path.dirname(args.output), "phylopack_tmp")
-        os.makedirs(tmpdir, exist_ok=True)
-    else:
-        os.makedirs(os.path.dirname(args.output), exist_ok=True)
-        tmpdir = tempfile.mkdtemp()
-
-    if args.verbose:
-        print(f'[INFO] Temp directory at: {tmpdir}')
-
+def run_stage(args, input_genomes, tmpdir):
     ref_file = os.path.join(tmpdir, "references.txt")
     rem_file = os.path.join(tmpdir, "remains.txt")
     leaf_order_file = os.path.join(tmpdir, "leaf_order.txt")
     node_order_file = os.path.join(tmpdir, "node_order.txt")
     output_tree = os.path.join(tmpdir, "tree.nw")
     output_std_tree = os.path.join(tmpdir, "tree_std.nw")
-    final_output_tmp = os.path.join(tmpdir, "placement_order.txt")
 
     split_args = argparse.Namespace(
-        input_genomes = args.input_genomes,
+        input_genomes = input_genomes,
         cut_point=args.cut_point,
         output=tmpdir,
         seed=args.seed,
@@ -115,7 +140,14 @@ def run_preorder_pipeline(args):
         output_tree=output_tree,
         output_std_tree=output_std_tree,
         leaf_order=leaf_order_file,
-        node_order=node_order_file
+        node_order=node_order_file,
+        tree_mode=args.tree_mode,
+        dc_clusters=args.dc_clusters,
+        dc_max_cluster=args.dc_max_cluster,
+        dc_sketch=args.s_placement,
+        dc_compare=args.dc_compare,
+        distance_store=args.distance_store,
+        catalog=args.catalog
     )
 
     run_attotree(attotree_args)
@@ -130,12 +162,256 @@ def run_preorder_pipeline(args):
         verbose=args.verbose,
         statistic=args.statistic,
         statistic_file_type=args.statistic_file_type,  
-        exclude_skeleton=args.exclude_skeleton
+        exclude_skeleton=args.exclude_skeleton,
+        outlier_distance=args.outlier_distance,
+        max_group_size=args.max_group_size,
+        cascade=args.cascade,
+        screen_k=args.screen_k,
+        screen_sketch=args.screen_sketch,
+        screen_top=args.screen_top,
+        cascade_recall=args.cascade_recall,
+        catalog=args.catalog
     )
 
     run_placement(placement_args)
 
+def read_groups(skeleton_tree):
+    # (leaf, sub-groups) per row, sub-groups of a split group are separated by an empty field
+    groups = []
+    with open(skeleton_tree) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not fields[0]:
+                continue
+            subgroups = [[]]
+            for x in fields[1:]:
+                if x:
+                    subgroups[-1].append(x)
+                elif subgroups[-1]:
+                    subgroups.append([])
+            groups.append((fields[0], [sub for sub in subgroups if sub]))
+    return groups
+
+def write_groups(skeleton_tree, groups):
+    with open(skeleton_tree, 'w') as f:
+        for leaf, subgroups in groups:
+            fields = [leaf]
+            for i, sub in enumerate(subgroups):
+                if i:
+                    fields.append('')
+                fields.extend(sub)
+            f.write('\t'.join(fields) + '\t\n')
+
+def refine_group(args, members, workdir):
+    os.makedirs(workdir, exist_ok=True)
+    genomes_file = os.path.join(workdir, "genomes.txt")
+    with open(genomes_file, 'w') as f:
+        for path in members:
+            f.write(path + '\n')
+
+    # Each group gets its own skeleton, sized like the top level one
+    cut_point = args.cut_point * len(members) if args.cut_point < 1 else args.cut_point
+    sub_args = argparse.Namespace(**vars(args))
+    sub_args.cut_point = min(max(3, int(cut_point)), len(members) - 1)
+
+    start = time.time()
+    run_stage(sub_args, genomes_file, workdir)
+    return time.time() - start
+
+def refine_groups(args, tmpdir):
+    catalog = GenomeCatalog.load(args.catalog)
+
+    sub_args = argparse.Namespace(**vars(args))
+    sub_args.verbose = False
+    sub_args.statistic = False
+    sub_args.exclude_skeleton = False
+    sub_args.tree_mode = 'monolithic'
+    sub_args.dc_compare = False
+    # Concurrent groups must not write the same store
+    sub_args.distance_store = None
+    # Custom lists and a top-level --nth do not fit the groups: every nth genome of a small
+    # group would leave fewer than the three references attotree needs
+    if sub_args.splitting_scheme in ('custom', 'nth-accession'):
+        sub_args.splitting_scheme = 'random'
+
+    children = {}
+    frontier = [tmpdir]
+    level_stats = []
+
+    for depth in range(1, args.recursive_depth + 1):
+        jobs = []
+        for workdir in frontier:
+            for leaf, subgroups in read_groups(os.path.join(workdir, "skeleton_tree.tsv")):
+                members = [m for sub in subgroups for m in sub]
+                if len(members) > args.recursive_threshold:
+                    child = os.path.join(workdir, f"level_{depth}_{len(jobs)}")
+                    children.setdefault(workdir, {})[leaf] = child
+                    jobs.append((catalog.paths(catalog.ids(members)), child))
+        if not jobs:
+            break
+
+        workers = min(len(jobs), args.t)
+        sub_args.t = max(1, args.t // workers)
+
+        if args.verbose:
+            print(f"[INFO] Level {depth}: refining {len(jobs)} groups with {workers} workers")
+
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(refine_group, sub_args, members, child) for members, child in jobs]
+            group_times = [future.result() for future in futures]
+
+        sizes = [len(members) for members, _ in jobs]
+        level_stats.append({
+            "level": depth,
+            "groups": len(jobs),
+            "genomes": sum(sizes),
+            "max_group_size": max(sizes),
+            "wall_time": round(time.time() - start, 4),
+            "max_group_wall_time": round(max(group_times), 4),
+        })
+        frontier = [child for _, child in jobs]
+
+    # Rebuild the order bottom-up, refined groups replaced by their own preorder
+    def assemble(workdir, exclude_skeleton):
+        order = []
+        groups = []
+        for leaf, subgroups in read_groups(os.path.join(workdir, "skeleton_tree.tsv")):
+            if leaf in children.get(workdir, {}):
+                subgroups = [assemble(children[workdir][leaf], False)[0]]
+            if not exclude_skeleton:
+                order.append(leaf)
+            for sub in subgroups:
+                order.extend(sub)
+            groups.append((leaf, subgroups))
+        with open(os.path.join(workdir, "outliers.txt")) as f:
+            order.extend(line.strip() for line in f if line.strip())
+        return order, groups
+
+    order, groups = assemble(tmpdir, args.exclude_skeleton)
+
+    with open(os.path.join(tmpdir, "placement_order.txt"), 'w') as f:
+        for name in order:
+            f.write(name + '\n')
+    write_groups(os.path.join(tmpdir, "skeleton_tree.tsv"), groups)
+
+    return level_stats
+
+def map_custom_references(custom_ref, rep_file, duplicates, output):
+    # Collapsed custom references are replaced by their representative, listed once
+    with open(rep_file) as f:
+        rep_paths = {genome_name(line): line.strip() for line in f if line.strip()}
+    rep_of = {dup: rep for rep, dups in duplicates.items() for dup in dups}
+    written = set()
+    with open(custom_ref) as f, open(output, 'w') as out:
+        for line in f:
+            if not line.strip():
+                continue
+            name = rep_of.get(genome_name(line), genome_name(line))
+            path = rep_paths.get(name, line.strip())
+            if path not in written:
+                written.add(path)
+                out.write(path + '\n')
+
+def place_excluded_duplicates(tmpdir, duplicates):
+    # Excluded skeleton genomes are missing from the order: their duplicates take their position
+    with open(os.path.join(tmpdir, "outliers.txt")) as f:
+        outliers = [line.strip() for line in f if line.strip()]
+    with open(os.path.join(tmpdir, "placement_order.txt"), 'w') as f:
+        for leaf, subgroups in read_groups(os.path.join(tmpdir, "skeleton_tree.tsv")):
+            for name in duplicates.get(leaf, []) + [m for sub in subgroups for m in sub]:
+                f.write(name + '\n')
+        for name in outliers:
+            f.write(name + '\n')
+
+def write_level_stats(level_stats, tmpdir, file_type):
+    stats_path = os.path.join(tmpdir, f"recursive_stats.{file_type}")
+    if file_type == 'json':
+        with open(stats_path, 'w') as f:
+            json.dump({"levels": level_stats}, f, indent=2)
+    elif file_type == 'csv':
+        with open(stats_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Category', 'Key', 'Value'])
+            for level in level_stats:
+                for k, v in level.items():
+                    if k != 'level':
+                        writer.writerow(['level', f"{level['level']}.{k}", v])
+
+def run_preorder_pipeline(args):
+    # Smaller groups would get fewer than the three references attotree needs
+    if args.recursive_threshold is not None and args.recursive_threshold < 4:
+        raise ValueError("--recursive-threshold must be at least 4")
+    if args.tree_mode == 'dc' and args.distance_store:
+        raise ValueError("--distance-store is only supported with --tree-mode monolithic")
+
+    if args.debug:
+        tmpdir = os.path.join(os.path.dirname(args.output), "phylopack_tmp")
+        os.makedirs(tmpdir, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        tmpdir = tempfile.mkdtemp()
+
+    if args.verbose:
+        print(f'[INFO] Temp directory at: {tmpdir}')
+
+    final_output_tmp = os.path.join(tmpdir, "placement_order.txt")
+    rep_file = os.path.join(tmpdir, "representatives.txt")
+    dup_file = os.path.join(tmpdir, "duplicates.tsv")
+
+    input_genomes = args.input_genomes
+
+    # One catalog per run: every stage maps genome names and paths through its IDs.
+    # Custom references need not be in the input list, so they are cataloged too
+    args.catalog = os.path.join(tmpdir, CATALOG_FILE)
+    catalog_lists = [args.input_genomes]
+    if args.splitting_scheme == 'custom':
+        catalog_lists.append(args.custom_ref)
+    GenomeCatalog.from_list(*catalog_lists).save(args.catalog)
+
+    if args.dedup_distance is not None:
+        dedup_args = argparse.Namespace(
+            input_genomes=args.input_genomes,
+            output=tmpdir,
+            distance=args.dedup_distance,
+            k=args.k,
+            s=args.s_placement,
+            t=args.t,
+            lsh_bands=args.lsh_bands,
+            lsh_rows=args.lsh_rows,
+            verbose=args.verbose,
+            statistic=args.statistic,
+            statistic_file_type=args.statistic_file_type,
+            rep_output=rep_file,
+            dup_output=dup_file
+        )
+
+        run_dedup(dedup_args)
+        input_genomes = rep_file
+
+        if args.splitting_scheme == 'custom':
+            custom_ref = os.path.join(tmpdir, "custom_references.txt")
+            map_custom_references(args.custom_ref, rep_file, load_duplicates(dup_file), custom_ref)
+            args.custom_ref = custom_ref
+
+    run_stage(args, input_genomes, tmpdir)
+
+    if args.recursive_threshold is not None:
+        level_stats = refine_groups(args, tmpdir)
+        write_level_stats(level_stats, tmpdir, args.statistic_file_type)
+
+    if args.dedup_distance is not None:
+        # Re-expand duplicates next to their representative
+        duplicates = load_duplicates(dup_file)
+        if args.exclude_skeleton:
+            place_excluded_duplicates(tmpdir, duplicates)
+        for path in [final_output_tmp, os.path.join(tmpdir, "skeleton_tree.tsv"), os.path.join(tmpdir, "outliers.txt")]:
+            expand_duplicates(path, duplicates)
+
     shutil.copyfile(final_output_tmp, args.output)
+    # Inputs of the batch planner and the run's catalog, kept next to the preorder
+    for name in ["tree_std.nw", "skeleton_tree.tsv", "outliers.txt", CATALOG_FILE]:
+        shutil.copyfile(os.path.join(tmpdir, name), os.path.join(os.path.dirname(args.output), name))
 
     if args.verbose:
         print(f"[INFO] Preorder written to {args.output}")
@@ -146,6 +422,10 @@ def run_preorder_pipeline(args):
             os.path.join(tmpdir, "tree_stats." + args.statistic_file_type),
             os.path.join(tmpdir, "placement_stats." + args.statistic_file_type),
         ]
+        if args.dedup_distance is not None:
+            stat_paths.insert(0, os.path.join(tmpdir, "dedup_stats." + args.statistic_file_type))
+        if args.recursive_threshold is not None:
+            stat_paths.append(os.path.join(tmpdir, "recursive_stats." + args.statistic_file_type))
 
         basename = os.path.splitext(os.path.basename(args.output))[0]
 
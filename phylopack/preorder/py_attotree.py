@@ -6,9 +6,15 @@ from datetime import datetime
 import json
 import csv
 import resource
-from pathlib import Path
 import sys
+import math
+from concurrent.futures import ProcessPoolExecutor
+import ete3
+import numpy as np
 from phylopack.preorder.postprocess_tree import run as postprocesstree
+from phylopack.preorder.distance_store import DistanceStore
+from phylopack.preorder.placement import mash_sketch, mash_distance, argmin
+from phylopack.preorder.catalog import GenomeCatalog, genome_name, load_catalog
 
 def add_tree_args(parser):
     parser.add_argument('input_genomes', help='Path to the input list of genomes')
@@ -29,6 +35,16 @@ def add_tree_args(parser):
     parser.add_argument('--output-std-tree', help='Custom path for the standardized tree file')
     parser.add_argument('--leaf-order', help='Custom path for the leaf order file')
     parser.add_argument('--node-order', help='Custom path for the internal node info file')
+    parser.add_argument(
+        '--tree-mode', choices=['monolithic', 'dc'], default='monolithic',
+        help='monolithic: one attotree run; dc: divide-and-conquer over sketch clusters (default: monolithic)'
+    )
+    parser.add_argument('--dc-clusters', type=int, help='Number of clusters in dc mode (default: square root of the number of genomes)')
+    parser.add_argument('--dc-max-cluster', type=int, help='Re-split clusters larger than this in dc mode (default: twice the mean cluster size)')
+    parser.add_argument('--dc-sketch', type=int, default=1000, help='Sketch size used to partition genomes in dc mode (default: 1000)')
+    parser.add_argument('--dc-compare', action='store_true', help='In dc mode, also build the monolithic tree and compare wall time and topology')
+    parser.add_argument('--distance-store', help='Directory of stored pairwise distances reused across runs (monolithic mode only, rejected with --tree-mode dc)')
+    parser.add_argument('--catalog', help='Genome catalog (genome_catalog.npz) or genome list used to map leaves back to paths')
 
 def extract_timestamp(line):
     ts_part = ' '.join(line.split(' ')[1:3])
@@ -43,7 +59,251 @@ def get_duration(lines, start_keyword, end_keyword):
         return round((end_time - start_time).total_seconds(), 4)
     return None
 
+def attotree_build(input_path, output_tree, k, s, t, m):
+    cmd = [
+        "attotree",
+        "-L", input_path,
+        "-o", output_tree,
+        "-k", str(k),
+        "-s", str(s),
+        "-t", str(t),
+        "-m", m
+    ]
+    start = time.time()
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return result.stdout + result.stderr, time.time() - start
+
+def small_tree(paths):
+    # quicktree needs at least three taxa
+    names = [genome_name(p) for p in paths]
+    if len(names) == 1:
+        return ete3.Tree(f"{names[0]};", format=1)
+    return ete3.Tree("(" + ",".join(f"{n}:0" for n in names) + ");", format=1)
+
+def build_subtree(paths, list_path, tree_path, k, s, t, m):
+    if len(paths) < 3:
+        small_tree(paths).write(outfile=tree_path, format=1)
+        return 0.0
+    with open(list_path, 'w') as f:
+        for p in paths:
+            f.write(p + '\n')
+    _, wall_time = attotree_build(list_path, tree_path, k, s, t, m)
+    return wall_time
+
+def partition_genomes(genomes, work_dir, k, s, t, n_clusters, max_cluster=None, verbose=False):
+    # Evenly spaced representatives, every genome joins its nearest representative
+    step = max(1, len(genomes) // n_clusters)
+    reps = genomes[::step][:n_clusters]
+
+    all_list = os.path.join(work_dir, "dc_genomes.txt")
+    reps_list = os.path.join(work_dir, "dc_representatives.txt")
+    with open(all_list, 'w') as f:
+        for g in genomes:
+            f.write(g + '\n')
+    with open(reps_list, 'w') as f:
+        for g in reps:
+            f.write(g + '\n')
+
+    sketch_all, _ = mash_sketch(all_list, work_dir, k, s, t, verbose)
+    sketch_reps, _ = mash_sketch(reps_list, work_dir, k, s, t, verbose)
+    distance_file, _ = mash_distance(sketch_all, sketch_reps, t, work_dir, verbose)
+    groups, outliers, _, _ = argmin(distance_file, genomes, reps, outlier_distance=1.0, verbose=verbose)
+    clusters = [groups[rep] for rep in reps if groups.get(rep)]
+
+    # Genomes sharing no hashes with any representative would all tie on the first one:
+    # they get clusters of their own instead
+    size = max_cluster or max(1, len(outliers))
+    clusters.extend(outliers[i:i + size] for i in range(0, len(outliers), size))
+
+    if max_cluster is not None:
+        capped = []
+        for i, cluster in enumerate(clusters):
+            if len(cluster) <= max_cluster:
+                capped.append(cluster)
+                continue
+            # Re-partition an over-full cluster once, cut what is still too large in input order
+            sub_dir = os.path.join(work_dir, f"split_{i}")
+            os.makedirs(sub_dir, exist_ok=True)
+            sub_clusters = partition_genomes(cluster, sub_dir, k, s, t, math.ceil(len(cluster) / max_cluster), verbose=verbose)
+            for sub in sub_clusters.values():
+                capped.extend(sub[j:j + max_cluster] for j in range(0, len(sub), max_cluster))
+        clusters = capped
+
+    # Each cluster is keyed by a member, its representative unless that one joined a tying one
+    rep_set = set(reps)
+    return {next((g for g in cluster if g in rep_set), cluster[0]): cluster for cluster in clusters}
+
+def build_dc_tree(input_path, output_tree, work_dir, k, s, t, m, n_clusters, dc_sketch, max_cluster=None, verbose=False):
+    with open(input_path) as f:
+        genomes = [line.strip() for line in f if line.strip()]
+
+    work_dir = os.path.join(work_dir, "dc_tree")
+    os.makedirs(work_dir, exist_ok=True)
+
+    n_clusters = n_clusters or max(1, round(math.sqrt(len(genomes))))
+    max_cluster = max_cluster or 2 * math.ceil(len(genomes) / n_clusters)
+
+    start = time.time()
+    clusters = partition_genomes(genomes, work_dir, k, dc_sketch, t, n_clusters, max_cluster, verbose)
+    partition_time = time.time() - start
+
+    if verbose:
+        sizes = [len(c) for c in clusters.values()]
+        print(f"[INFO] Partitioned {len(genomes)} genomes into {len(clusters)} clusters (largest: {max(sizes)})")
+
+    # Subtrees in parallel, threads shared between the concurrent attotree runs
+    start = time.time()
+    reps = list(clusters)
+    workers = max(1, min(len(reps), t))
+    threads = max(1, t // workers)
+    sub_trees = [os.path.join(work_dir, f"cluster_{i}.nw") for i in range(len(reps))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                build_subtree, clusters[rep], os.path.join(work_dir, f"cluster_{i}.txt"),
+                sub_trees[i], k, s, threads, m
+            )
+            for i, rep in enumerate(reps)
+        ]
+        for future in futures:
+            future.result()
+    subtree_time = time.time() - start
+
+    # Backbone tree on the cluster representatives
+    start = time.time()
+    backbone_tree = os.path.join(work_dir, "backbone.nw")
+    build_subtree(reps, os.path.join(work_dir, "backbone.txt"), backbone_tree, k, s, t, m)
+    backbone_time = time.time() - start
+
+    # Graft every cluster subtree in place of its representative leaf
+    start = time.time()
+    tree = ete3.Tree(backbone_tree, format=1)
+    leaves = {leaf.name: leaf for leaf in tree.get_leaves()}
+    for i, rep in enumerate(reps):
+        sub = ete3.Tree(sub_trees[i], format=1)
+        if len(sub) == 1:
+            continue
+        if len(sub) > 2:
+            sub.set_outgroup(sub.get_midpoint_outgroup())
+        leaf = leaves[genome_name(rep)]
+        if leaf.up is None:
+            tree = sub
+        else:
+            sub.dist = leaf.dist
+            parent = leaf.up
+            parent.remove_child(leaf)
+            parent.add_child(sub)
+    tree.write(outfile=output_tree, format=1)
+    join_time = time.time() - start
+
+    return {
+        "clusters": len(reps),
+        "max_cluster": max_cluster,
+        "largest_cluster": max(len(c) for c in clusters.values()),
+        "partition_time": round(partition_time, 4),
+        "subtree_time": round(subtree_time, 4),
+        "backbone_time": round(backbone_time, 4),
+        "join_time": round(join_time, 4),
+    }
+
+def read_mash_table(distance_file):
+    with open(distance_file) as f:
+        next(f)
+        return np.array([line.rstrip('\n').split('\t')[1:] for line in f], dtype=np.float32)
+
+def write_phylip(matrix, names, phylip_file):
+    # Lower triangle, as written by mash triangle
+    with open(phylip_file, 'w') as f:
+        f.write(f"{len(names)}\n")
+        for i, name in enumerate(names):
+            f.write('\t'.join([name] + [str(x) for x in matrix[i, :i]]) + '\n')
+
+def build_tree_from_store(input_path, output_tree, work_dir, store_root, k, s, t, m, verbose=False):
+    with open(input_path) as f:
+        genomes = [line.strip() for line in f if line.strip()]
+    names = [genome_name(g) for g in genomes]
+
+    work_dir = os.path.join(work_dir, "distance_store")
+    os.makedirs(work_dir, exist_ok=True)
+
+    start = time.time()
+    # The store stays locked from loading its distances to saving the new ones
+    with DistanceStore(store_root, k, s) as store:
+        n_stored = len(store.names)
+        ids = store.ids(names)
+        matrix = store.matrix(ids)
+
+        n_pairs = len(names) * (len(names) - 1) // 2
+        missing = np.isnan(matrix)
+        reused_pairs = n_pairs - int(missing.sum()) // 2
+
+        # Genomes new to the store, then a greedy cover of the remaining unknown pairs,
+        # are compared against every reference
+        picked = ids >= n_stored
+        residual = missing & ~picked[:, None] & ~picked[None, :]
+        counts = residual.sum(axis=1)
+        for i in np.argsort(-counts, kind='stable'):
+            if counts[i] == 0:
+                break
+            if residual[i, ~picked].any():
+                picked[i] = True
+        computed = np.flatnonzero(picked)
+        if len(computed):
+            all_list = os.path.join(work_dir, "store_genomes.txt")
+            new_list = os.path.join(work_dir, "store_missing.txt")
+            with open(all_list, 'w') as f:
+                for g in genomes:
+                    f.write(g + '\n')
+            with open(new_list, 'w') as f:
+                for i in computed:
+                    f.write(genomes[i] + '\n')
+            sketch_all, _ = mash_sketch(all_list, work_dir, k, s, t, verbose)
+            sketch_new, _ = mash_sketch(new_list, work_dir, k, s, t, verbose)
+            distance_file, _ = mash_distance(sketch_new, sketch_all, t, work_dir, verbose)
+            table = read_mash_table(distance_file)
+            matrix[computed, :] = table
+            matrix[:, computed] = table.T
+            store.put(np.repeat(ids[computed], len(ids)), np.tile(ids, len(computed)), table.ravel())
+            store.save()
+    mash_time = time.time() - start
+
+    if verbose:
+        print(f"[INFO] Reused {reused_pairs} of {n_pairs} pairwise distances from {store.path}")
+
+    start = time.time()
+    phylip_file = os.path.join(work_dir, "distances.phylip")
+    write_phylip(matrix, names, phylip_file)
+    cmd = ["quicktree", "-in", "m"]
+    if m == "upgma":
+        cmd += ["-upgma"]
+    result = subprocess.run(cmd + [phylip_file], capture_output=True, text=True, check=True)
+    with open(output_tree, 'w') as f:
+        f.write("".join(line.strip() for line in result.stdout.splitlines()))
+    quicktree_time = time.time() - start
+
+    return {
+        "pairs": n_pairs,
+        "reused_pairs": reused_pairs,
+        "reused_fraction": round(reused_pairs / n_pairs, 4) if n_pairs else None,
+        "computed_genomes": len(computed),
+        "stored_genomes": len(store.names),
+        "distance_time": round(mash_time, 4),
+        "quicktree_time": round(quicktree_time, 4),
+    }
+
+def compare_trees(tree_1, tree_2):
+    t1 = ete3.Tree(tree_1, format=1)
+    t2 = ete3.Tree(tree_2, format=1)
+    rf, max_rf = t1.robinson_foulds(t2, unrooted_trees=True)[:2]
+    return {
+        "robinson_foulds": rf,
+        "max_robinson_foulds": max_rf,
+        "normalized_robinson_foulds": round(rf / max_rf, 4) if max_rf else 0.0,
+    }
+
 def run_attotree(args):
+    if args.tree_mode == 'dc' and args.distance_store:
+        raise ValueError("--distance-store is only supported with --tree-mode monolithic")
 
     input_path = args.input_genomes
     output_basename = os.path.splitext(os.path.basename(input_path))[0]
@@ -57,20 +317,33 @@ def run_attotree(args):
     wall_start = time.time()
     cpu_start = os.times()
 
-    cmd = [
-        "attotree",
-        "-L", input_path,
-        "-o", output_tree,
-        "-k", str(args.k),
-        "-s", str(args.s),
-        "-t", str(args.t),
-        "-m", args.m
-    ]
-
+    dc_stats = {}
+    store_stats = {}
+    if args.tree_mode == 'dc':
+        dc_start = time.time()
+        dc_stats = build_dc_tree(
+            input_path, output_tree, args.output, args.k, args.s, args.t, args.m,
+            args.dc_clusters, args.dc_sketch, args.dc_max_cluster, args.verbose
+        )
+        dc_stats["wall_time"] = round(time.time() - dc_start, 4)
+        attotree_log = ""
 
-    # Run attotree and capture output
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    attotree_log = result.stdout + result.stderr  
+        if args.dc_compare:
+            monolithic_tree = os.path.join(args.output, f"{output_basename}_monolithic.nw")
+            _, monolithic_time = attotree_build(input_path, monolithic_tree, args.k, args.s, args.t, args.m)
+            dc_stats["monolithic_wall_time"] = round(monolithic_time, 4)
+            dc_stats.update(compare_trees(output_tree, monolithic_tree))
+            if args.verbose:
+                print(f"[INFO] dc tree {dc_stats['wall_time']}s vs monolithic {dc_stats['monolithic_wall_time']}s, "
+                      f"RF {dc_stats['robinson_foulds']}/{dc_stats['max_robinson_foulds']}")
+    elif args.distance_store:
+        store_stats = build_tree_from_store(
+            input_path, output_tree, args.output, args.distance_store, args.k, args.s, args.t, args.m, args.verbose
+        )
+        attotree_log = ""
+    else:
+        # Run attotree and capture output
+        attotree_log, _ = attotree_build(input_path, output_tree, args.k, args.s, args.t, args.m)
 
     # Run postprocess_tree.py
     # cmd_postprocess = [
@@ -89,19 +362,15 @@ def run_attotree(args):
 
     # Re-add full paths to leaf_order.txt
 
-    # Build filename full path mapping from original genome list
-    path_map = {}
-    with open(input_path) as f:
-        for line in f:
-            basename = os.path.basename(line.strip())
-            genome_acession = Path(basename).name.split('.')[0]
-            path_map[genome_acession] = line.strip()
-    
+    # Leaves are genome names, mapped back to paths through the catalog
+    catalog = load_catalog(args.catalog) if args.catalog else GenomeCatalog.from_list(input_path)
+
     # Patch leaf_order.txt in-place
     with open(leaf_order) as f:
         leaves = [line.strip() for line in f]
 
-    missing = [leaf for leaf in leaves if leaf not in path_map]
+    leaf_ids = catalog.lookup(leaves)
+    missing = [leaf for leaf, i in zip(leaves, leaf_ids) if i < 0]
     if missing:
         print("Error: some leaves not found in input list:")
         for m in missing:
@@ -109,8 +378,8 @@ def run_attotree(args):
         sys.exit(1)  # Exit with error code 1
 
     with open(leaf_order, 'w') as f:
-        for leaf in leaves:
-            f.write(path_map.get(leaf, leaf) + '\n')
+        for i in leaf_ids:
+            f.write(catalog.path(i) + '\n')
     
 
     wall_end = time.time()
@@ -119,6 +388,9 @@ def run_attotree(args):
 
     mash_time = get_duration(attotree_log.splitlines(), 'Running Mash', "Finished: 'mash triangle")
     quicktree_time = get_duration(attotree_log.splitlines(), 'Running Quicktree', "Finished: 'quicktree")
+    if store_stats:
+        mash_time = store_stats["distance_time"]
+        quicktree_time = store_stats["quicktree_time"]
 
     if args.verbose:
         print(f'[INFO] Tree inference elapsed time: {round(wall_end - wall_start, 4)}s')
@@ -130,7 +402,9 @@ def run_attotree(args):
             "k": args.k,
             "sketch_size": args.s,
             "threads": args.t,
-            "method": args.m
+            "method": args.m,
+            "tree_mode": args.tree_mode,
+            "distance_store": args.distance_store
         },
         "timings": {
             "total": {
@@ -141,6 +415,8 @@ def run_attotree(args):
             "mash_triangle_time": mash_time,
             "quicktree_time": quicktree_time
         },
+        "divide_and_conquer": dc_stats,
+        "distance_store": store_stats,
         "resources": {
             "max_rss_MB": round(usage.ru_maxrss / 1000, 2)
         }
@@ -163,6 +439,10 @@ def run_attotree(args):
                             writer.writerow(['timing', f"{k}.{subk}", subv])
                     else:
                         writer.writerow(['timing', k, v])
+                for k, v in stats['divide_and_conquer'].items():
+                    writer.writerow(['divide_and_conquer', k, v])
+                for k, v in stats['distance_store'].items():
+                    writer.writerow(['distance_store', k, v])
                 for k, v in stats['resources'].items():
                     writer.writerow(['resource', k, v])
         if args.verbose:
@@ -0,0 +1,349 @@
+import argparse
+import os
+import time
+import json
+import queue
+import shutil
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from phylopack.preorder.placement import mash_sketch
+from phylopack.preorder.sketch import load_sketch_hashes, mash_distance_from_hashes
+from phylopack.preorder.catalog import genome_name
+
+def add_serve_parser(subparsers):
+    serve_parser = subparsers.add_parser("serve", help="Serve placements against an in-memory skeleton")
+    add_serve_args(serve_parser)
+    serve_parser.set_defaults(func=run_serve)
+
+def add_serve_args(parser):
+    parser.add_argument('leaf_order', help='Skeleton genomes in tree leaf order (leaf_order.txt, full paths)')
+    parser.add_argument('--skeleton-sketch', help='Existing Mash sketch of the skeleton (.msh), built from leaf_order otherwise')
+    parser.add_argument('--skeleton-tree', help='Placement groups (skeleton_tree.tsv) to start insertion positions from')
+    parser.add_argument('--socket', help='Listen on this Unix socket path instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port (default: 8765)')
+    parser.add_argument('-k', type=int, default=21, help='K-mer size (default: 21)')
+    parser.add_argument('-s', type=int, default=1000, help='Sketch size (default: 1000)')
+    parser.add_argument('-t', type=int, default=10, help='Number of threads (default: 10)')
+    parser.add_argument('--batch-window', type=float, default=0.05, help='Seconds to gather concurrent requests into one batch (default: 0.05)')
+    parser.add_argument('--max-batch', type=int, default=256, help='Maximum genomes per batch (default: 256)')
+    parser.add_argument('--rerank', type=int, default=8, help='References ranked by shared hashes that get an exact Mash distance (default: 8)')
+    parser.add_argument(
+        '--outlier-distance', type=float, default=1.0,
+        help='Genomes whose nearest reference is at or beyond this distance are placed last as outliers (default: 1.0)'
+    )
+    parser.add_argument('--exclude-skeleton', action='store_true', help='The skeleton genomes are not part of the preorder')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print logs')
+
+class PositionIndex:
+    # Fenwick tree over group sizes in leaf order: insertion positions in O(log n)
+    def __init__(self, sizes):
+        self.n = len(sizes)
+        self.tree = [0] * (self.n + 1)
+        for i, size in enumerate(sizes):
+            self.add(i, size)
+
+    def add(self, i, value):
+        i += 1
+        while i <= self.n:
+            self.tree[i] += value
+            i += i & -i
+
+    def prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+class Skeleton:
+    def __init__(self, args, work_dir):
+        with open(args.leaf_order) as f:
+            self.paths = [line.strip() for line in f if line.strip()]
+        self.names = [genome_name(p) for p in self.paths]
+        self.k = args.k
+        self.s = args.s
+        self.rerank = args.rerank
+        self.outlier_distance = args.outlier_distance
+
+        sketch = args.skeleton_sketch
+        if sketch is None:
+            sketch, _ = mash_sketch(args.leaf_order, work_dir, args.k, args.s, args.t, args.verbose)
+        elif sketch.endswith('.msh'):
+            sketch = sketch[:-len('.msh')]
+        by_name = load_sketch_hashes(sketch)
+        self.hashes = [by_name[p] for p in self.paths]
+
+        # Inverted index: every reference hash, sorted, with its leaf index
+        lengths = [len(h) for h in self.hashes]
+        all_hashes = np.concatenate(self.hashes) if self.hashes else np.array([], dtype=np.uint64)
+        all_ids = np.repeat(np.arange(len(self.hashes)), lengths)
+        order = np.argsort(all_hashes, kind='stable')
+        self.index_hashes = all_hashes[order]
+        self.index_ids = all_ids[order]
+
+        base = 0 if args.exclude_skeleton else 1
+        sizes = [base] * len(self.paths)
+        if args.skeleton_tree:
+            position = {n: i for i, n in enumerate(self.names)}
+            with open(args.skeleton_tree) as f:
+                for line in f:
+                    fields = [x for x in line.rstrip('\n').split('\t') if x]
+                    if fields and fields[0] in position:
+                        sizes[position[fields[0]]] += len(fields) - 1
+        self.positions = PositionIndex(sizes)
+        self.total = sum(sizes)
+        self.lock = threading.Lock()
+
+    def nearest(self, query):
+        lo = np.searchsorted(self.index_hashes, query, side='left')
+        hi = np.searchsorted(self.index_hashes, query, side='right')
+        counts = hi - lo
+        if counts.sum() == 0:
+            return None, 1.0
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        ids = self.index_ids[starts + np.arange(counts.sum())]
+        shared = np.bincount(ids, minlength=len(self.hashes))
+
+        n = min(self.rerank, len(shared))
+        candidates = np.argpartition(-shared, n - 1)[:n]
+        candidates = sorted(int(c) for c in candidates if shared[c] > 0)
+        best, best_dist = None, 1.0
+        for c in candidates:
+            dist = mash_distance_from_hashes(query, self.hashes[c], self.k, self.s)
+            if best is None or dist < best_dist:
+                best, best_dist = c, dist
+        return best, best_dist
+
+    def place(self, path, query):
+        leaf, dist = self.nearest(query)
+        with self.lock:
+            if leaf is None or dist >= self.outlier_distance:
+                # Outliers go after every skeleton group
+                position = self.total
+                reference = None
+            else:
+                position = self.positions.prefix(leaf + 1)
+                self.positions.add(leaf, 1)
+                reference = self.names[leaf]
+            self.total += 1
+        return {
+            'genome': genome_name(path),
+            'reference': reference,
+            'leaf_index': leaf,
+            'distance': dist,
+            'position': position,
+        }
+
+class Batcher:
+    def __init__(self, skeleton, args, work_dir):
+        self.skeleton = skeleton
+        self.args = args
+        self.work_dir = work_dir
+        self.requests = queue.Queue()
+        self.latencies = []
+        self.batch_sizes = []
+        self.failed_genomes = 0
+        self.stats_lock = threading.Lock()
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, paths):
+        request = {'paths': paths, 'done': threading.Event(), 'result': None, 'error': None}
+        self.requests.put(request)
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['result']
+
+    def loop(self):
+        batch_id = 0
+        while True:
+            batch = [self.requests.get()]
+            n_genomes = len(batch[0]['paths'])
+            deadline = time.time() + self.args.batch_window
+            while n_genomes < self.args.max_batch:
+                try:
+                    request = self.requests.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_genomes += len(request['paths'])
+            batch_id += 1
+            self.run_batch(batch, batch_id)
+
+    def sketch_hashes(self, paths, name):
+        list_path = os.path.join(self.work_dir, f"{name}.txt")
+        with open(list_path, 'w') as f:
+            for p in paths:
+                f.write(p + '\n')
+        try:
+            sketch, _ = mash_sketch(list_path, self.work_dir, self.args.k, self.args.s, self.args.t, self.args.verbose)
+            return load_sketch_hashes(sketch)
+        finally:
+            # Removed on failure too
+            for path in (list_path, os.path.join(self.work_dir, f"{name}.msh")):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def sketch_isolating(self, paths, name, hashes, placed):
+        # A genome mash cannot sketch fails the whole run: bisect until it is isolated
+        try:
+            hashes.update(self.sketch_hashes(paths, name))
+        except Exception:
+            if len(paths) == 1:
+                placed[paths[0]] = {'genome': genome_name(paths[0]), 'error': f'mash could not sketch {paths[0]}'}
+            else:
+                half = len(paths) // 2
+                self.sketch_isolating(paths[:half], f"{name}_0", hashes, placed)
+                self.sketch_isolating(paths[half:], f"{name}_1", hashes, placed)
+
+    def run_batch(self, batch, batch_id):
+        try:
+            paths = list(dict.fromkeys(p for request in batch for p in request['paths']))
+            # Errors are reported per genome, the rest of the batch is still placed
+            placed = {
+                p: {'genome': genome_name(p), 'error': f'cannot read {p}'}
+                for p in paths if not (os.path.isfile(p) and os.access(p, os.R_OK))
+            }
+            readable = [p for p in paths if p not in placed]
+            hashes = {}
+            if readable:
+                # One mash process sketches every genome of every request in the batch
+                self.sketch_isolating(readable, f"batch_{batch_id}", hashes, placed)
+            for p in readable:
+                if p in placed:
+                    continue
+                if p in hashes:
+                    placed[p] = self.skeleton.place(p, hashes[p])
+                else:
+                    placed[p] = {'genome': genome_name(p), 'error': f'{p} missing from the sketch'}
+            for request in batch:
+                request['result'] = [placed[p] for p in request['paths']]
+            failed = sum(1 for p in paths if 'error' in placed[p])
+        except Exception as e:
+            for request in batch:
+                request['error'] = e
+            failed = 0
+        with self.stats_lock:
+            self.batch_sizes.append(len(batch))
+            self.failed_genomes += failed
+        for request in batch:
+            request['done'].set()
+
+    def record(self, latency):
+        with self.stats_lock:
+            self.latencies.append(latency)
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = np.array(self.latencies)
+            batch_sizes = list(self.batch_sizes)
+            failed_genomes = self.failed_genomes
+        result = {
+            "requests": len(latencies),
+            "batches": len(batch_sizes),
+            "mean_requests_per_batch": round(float(np.mean(batch_sizes)), 4) if batch_sizes else None,
+            "failed_genomes": failed_genomes,
+            "skeleton_genomes": len(self.skeleton.paths),
+            "latency_ms": {},
+        }
+        if len(latencies):
+            for p in (50, 90, 95, 99):
+                result["latency_ms"][f"p{p}"] = round(float(np.percentile(latencies, p)) * 1000, 3)
+            result["latency_ms"]["max"] = round(float(latencies.max()) * 1000, 3)
+        return result
+
+def make_handler(batcher, verbose):
+
+    class PlacementHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, batcher.stats())
+            else:
+                self.send_json(404, {'error': f'unknown endpoint {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/place':
+                self.send_json(404, {'error': f'unknown endpoint {self.path}'})
+                return
+            start = time.time()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                placements = batcher.submit(list(body['genomes']))
+            except (ValueError, KeyError, TypeError) as e:
+                code, payload = 400, {'error': str(e)}
+            except Exception as e:
+                code, payload = 500, {'error': str(e)}
+            else:
+                code, payload = 200, {'placements': placements}
+            # Failed requests count towards the latency percentiles too
+            batcher.record(time.time() - start)
+            self.send_json(code, payload)
+
+        def address_string(self):
+            # Unix socket clients have no host/port
+            return str(self.client_address[0]) if self.client_address else 'unix'
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return PlacementHandler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def run_serve(args):
+    work_dir = tempfile.mkdtemp()
+
+    start = time.time()
+    skeleton = Skeleton(args, work_dir)
+    batcher = Batcher(skeleton, args, work_dir)
+    handler = make_handler(batcher, args.verbose)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, handler)
+        address = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        address = f"http://{args.host}:{server.server_address[1]}"
+
+    print(f"[INFO] Loaded {len(skeleton.paths)} skeleton genomes in {round(time.time() - start, 4)}s")
+    print(f"[INFO] Serving placements on {address} (POST /place, GET /stats)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        shutil.rmtree(work_dir)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve genome placements against a skeleton kept in memory'
+    )
+    add_serve_args(parser)
+    args = parser.parse_args()
+    run_serve(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import json
+import subprocess
+
+import numpy as np
+
+PAD = np.iinfo(np.uint64).max
+
+def load_sketch_hashes(sketch):
+    result = subprocess.run(['mash', 'info', '-d', f'{sketch}.msh'], capture_output=True, text=True, check=True)
+    info = json.loads(result.stdout)
+    return {
+        entry['name']: np.unique(np.array(entry['hashes'], dtype=np.uint64))
+        for entry in info['sketches']
+    }
+
+def mash_distance_from_hashes(a, b, k, s):
+    # Same estimator as mash dist: Jaccard over the bottom-s hashes of the union
+    union = np.union1d(a, b)[:s]
+    if len(union) == 0:
+        return 1.0
+    common = np.count_nonzero(np.isin(union, a, assume_unique=True) & np.isin(union, b, assume_unique=True))
+    jaccard = common / len(union)
+    if jaccard == 0:
+        return 1.0
+    return max(0.0, -1.0 / k * np.log(2 * jaccard / (1 + jaccard)))
+
+def cardinality(hashes, s, k):
+    # Bottom-s estimate of the distinct k-mer count; mash hashes to 32 bits for k <= 16
+    if len(hashes) < s:
+        return float(len(hashes))
+    space = 2.0 ** (32 if k <= 16 else 64)
+    return (s - 1) * space / (float(hashes[s - 1]) + 1.0)
+
+def cardinalities(matrix, s, k):
+    # cardinality() for every row of a PAD-filled hash matrix
+    counts = (matrix != PAD).sum(axis=1)
+    space = 2.0 ** (32 if k <= 16 else 64)
+    with np.errstate(divide='ignore'):
+        estimate = (s - 1) * space / (matrix[:, s - 1].astype(np.float64) + 1.0)
+    return np.where(counts < s, counts, estimate)
+
+def merge_bottom(matrix_a, matrix_b, s):
+    # Row-wise bottom-s of the distinct union of two PAD-filled hash matrices
+    # Stable sort is a run-aware merge sort: two sorted runs per row merge in linear time
+    merged = np.sort(np.concatenate([matrix_a, matrix_b], axis=1), axis=1, kind='stable')
+    merged[:, 1:][merged[:, 1:] == merged[:, :-1]] = PAD
+    return np.sort(merged, axis=1, kind='stable')[:, :s]
+
+def hash_matrix(hashes, s):
+    # One sorted, PAD-filled row of sketch hashes per genome
+    matrix = np.full((len(hashes), s), PAD, dtype=np.uint64)
+    for i, h in enumerate(hashes):
+        h = h[:s]
+        matrix[i, :len(h)] = h
+    return matrix
+
+def pair_distances(matrix_a, matrix_b, k, s, batch_size):
+    # Mash estimator on row-aligned pairs: Jaccard over the bottom-s distinct hashes of the union
+    n = len(matrix_a)
+    distances = np.ones(n, dtype=np.float64)
+    for start in range(0, n, batch_size):
+        end = min(n, start + batch_size)
+        merged = np.sort(np.concatenate([matrix_a[start:end], matrix_b[start:end]], axis=1), axis=1)
+        dup = (merged[:, 1:] == merged[:, :-1]) & (merged[:, 1:] != PAD)
+        valid = merged != PAD
+        # Rank of every element among the distinct union values
+        rank = np.cumsum(valid, axis=1) - 1 - np.concatenate(
+            [np.zeros((len(merged), 1), dtype=np.int64), np.cumsum(dup, axis=1)], axis=1
+        )
+        union = np.minimum(s, valid.sum(axis=1) - dup.sum(axis=1))
+        common = (dup & (rank[:, 1:] < s)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jaccard = np.where(union > 0, common / union, 0.0)
+            d = np.where(jaccard > 0, -1.0 / k * np.log(2 * jaccard / (1 + jaccard)), 1.0)
+        distances[start:end] = np.maximum(d, 0.0)
+    return distances
+
+def adjacent_distances(matrix, k, s, batch_size):
+    return pair_distances(matrix[:-1], matrix[1:], k, s, batch_size)
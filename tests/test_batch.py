@@ -0,0 +1,195 @@
+import argparse
+import gzip
+import os
+
+import ete3
+import pytest
+
+from phylopack.batch.codec import zstandard
+from phylopack.batch.extract import run_extract
+from phylopack.batch.pack import cut_batches_from_plan, run_pack
+from phylopack.batch.plan import clade_segments, load_groups, merge_segments, read_batch_plan, run_plan
+from phylopack.preorder.catalog import genome_name
+
+FASTA_DIR = os.path.join(os.path.dirname(__file__), "data", "fasta_files")
+
+CODECS = [
+    "xz",
+    pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")),
+]
+
+def write_inputs(tmp_path):
+    paths = sorted(os.path.join(FASTA_DIR, f) for f in os.listdir(FASTA_DIR) if f.endswith(".fa.gz"))
+    genomes = tmp_path / "genomes.txt"
+    genomes.write_text("".join(p + "\n" for p in paths))
+    # Reverse input order, so batches do not follow the genome list
+    preorder = tmp_path / "preorder.txt"
+    preorder.write_text("".join(genome_name(p) + "\n" for p in reversed(paths)))
+    return paths, str(genomes), str(preorder)
+
+def pack_args(preorder, genomes, output, **kwargs):
+    args = dict(
+        preorder=preorder,
+        input_genomes=genomes,
+        output=output,
+        batch_genomes=4,
+        batch_bytes=None,
+        batch_plan=None,
+        codec="xz",
+        level=None,
+        frame_bytes=8 << 20,
+        t=2,
+        verbose=False,
+        statistic=False,
+        statistic_file_type="json",
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_pack_extract_round_trip(tmp_path, codec):
+    paths, genomes, preorder = write_inputs(tmp_path)
+    packed = str(tmp_path / "packed")
+    # Small frames, so genomes span several frames and frames hold several genomes
+    run_pack(pack_args(preorder, genomes, packed, codec=codec, frame_bytes=100000))
+
+    extracted = tmp_path / "extracted"
+    run_extract(argparse.Namespace(
+        packed=packed,
+        genomes=[genome_name(p) for p in paths],
+        genome_list=None,
+        output=str(extracted),
+        t=2,
+        benchmark=True,
+        verbose=False,
+        statistic=False,
+        statistic_file_type="json",
+    ))
+
+    for path in paths:
+        with gzip.open(path, "rb") as f:
+            assert (extracted / genome_name(path)).read_bytes() == f.read()
+
+def test_pack_requires_a_batching_option(tmp_path):
+    _, genomes, preorder = write_inputs(tmp_path)
+    with pytest.raises(ValueError):
+        run_pack(pack_args(preorder, genomes, str(tmp_path / "packed"), batch_genomes=None))
+
+@pytest.mark.parametrize("frame_bytes", [0, -1])
+def test_pack_rejects_frame_bytes_below_one(tmp_path, frame_bytes):
+    _, genomes, preorder = write_inputs(tmp_path)
+    with pytest.raises(ValueError):
+        run_pack(pack_args(preorder, genomes, str(tmp_path / "packed"), frame_bytes=frame_bytes))
+
+def test_extract_batch_of_empty_genomes(tmp_path):
+    paths, _, _ = write_inputs(tmp_path)
+    empty = []
+    for name in ("EMPTY1.fa.gz", "EMPTY2.fa.gz"):
+        path = tmp_path / name
+        with gzip.open(path, "wb"):
+            pass
+        empty.append(str(path))
+    # The empty genomes come first, so they fill a batch without any frames
+    genomes = tmp_path / "genomes.txt"
+    genomes.write_text("".join(p + "\n" for p in paths + empty))
+    preorder = tmp_path / "preorder.txt"
+    preorder.write_text("".join(genome_name(p) + "\n" for p in empty + paths))
+    packed = str(tmp_path / "packed")
+    run_pack(pack_args(str(preorder), str(genomes), packed, batch_genomes=2))
+
+    extracted = tmp_path / "extracted"
+    run_extract(argparse.Namespace(
+        packed=packed,
+        genomes=[genome_name(p) for p in empty + paths[:1]],
+        genome_list=None,
+        output=str(extracted),
+        t=2,
+        benchmark=True,
+        verbose=False,
+        statistic=False,
+        statistic_file_type="json",
+    ))
+
+    for path in empty:
+        assert (extracted / genome_name(path)).read_bytes() == b""
+    with gzip.open(paths[0], "rb") as f:
+        assert (extracted / genome_name(paths[0])).read_bytes() == f.read()
+
+PLAN_TREE = "((A,B)AB,(C,D)CD)root;"
+# C's group was split into three sub-groups, D has no placed genomes
+PLAN_GROUPS = "A\ta1\ta2\nB\tb1\nC\tc1\tc2\t\tc3\tc4\t\tc5\nD\n"
+
+def write_plan_inputs(tmp_path):
+    tree = tmp_path / "tree_std.nw"
+    tree.write_text(PLAN_TREE + "\n")
+    groups = tmp_path / "skeleton_tree.tsv"
+    groups.write_text(PLAN_GROUPS)
+    return str(tree), str(groups)
+
+@pytest.mark.parametrize("exclude_skeleton, expected", [
+    (False, {"A": [["A", "a1", "a2"]], "B": [["B", "b1"]], "C": [["C", "c1", "c2"], ["c3", "c4"], ["c5"]], "D": [["D"]]}),
+    (True, {"A": [["a1", "a2"]], "B": [["b1"]], "C": [["c1", "c2"], ["c3", "c4"], ["c5"]], "D": []}),
+])
+def test_load_groups(tmp_path, exclude_skeleton, expected):
+    _, groups = write_plan_inputs(tmp_path)
+    assert load_groups(groups, exclude_skeleton) == expected
+
+@pytest.mark.parametrize("exclude_skeleton, max_genomes, expected", [
+    # AB (5) fits whole, CD (7) does not and C (6) is cut at its sub-groups
+    (False, 5, [("AB", ["A", "a1", "a2", "B", "b1"]), ("C", ["C", "c1", "c2"]), ("C", ["c3", "c4"]), ("C", ["c5"]), ("D", ["D"])]),
+    (False, 4, [("A", ["A", "a1", "a2"]), ("B", ["B", "b1"]), ("C", ["C", "c1", "c2"]), ("C", ["c3", "c4"]), ("C", ["c5"]), ("D", ["D"])]),
+    # Sub-groups larger than the maximum are chunked
+    (False, 2, [("A", ["A", "a1"]), ("A", ["a2"]), ("B", ["B", "b1"]), ("C", ["C", "c1"]), ("C", ["c2"]), ("C", ["c3", "c4"]), ("C", ["c5"]), ("D", ["D"])]),
+    # Without skeleton genomes CD (5) fits and the empty leaf D adds nothing
+    (True, 5, [("AB", ["a1", "a2", "b1"]), ("CD", ["c1", "c2", "c3", "c4", "c5"])]),
+])
+def test_clade_segments(tmp_path, exclude_skeleton, max_genomes, expected):
+    tree, groups = write_plan_inputs(tmp_path)
+    segments = clade_segments(ete3.Tree(tree, format=1), load_groups(groups, exclude_skeleton), max_genomes)
+    assert segments == expected
+
+def segments_of(sizes):
+    return [(str(i), [f"{i}_{j}" for j in range(size)]) for i, size in enumerate(sizes)]
+
+@pytest.mark.parametrize("sizes, min_genomes, max_genomes, batch_sizes, split_clades", [
+    ([2, 2, 1], 1, 5, [5], 0),
+    ([3, 3], 2, 5, [3, 3], 0),
+    # The first batch is short of the minimum at the next clade boundary, so that clade is split
+    ([2, 4, 3], 3, 5, [5, 4], 1),
+    # The short last batch takes the tail of the previous one
+    ([5, 5, 2], 3, 5, [5, 4, 3], 1),
+])
+def test_merge_segments(sizes, min_genomes, max_genomes, batch_sizes, split_clades):
+    segments = segments_of(sizes)
+    batches, split = merge_segments(segments, min_genomes, max_genomes)
+    assert [len(b) for b in batches] == batch_sizes
+    assert split == split_clades
+    assert [g for b in batches for g in b] == [g for _, genomes in segments for g in genomes]
+
+def test_plan_batches_match_pack(tmp_path):
+    tree, groups = write_plan_inputs(tmp_path)
+    outliers = tmp_path / "outliers.txt"
+    outliers.write_text("o1\no2\n")
+    output = tmp_path / "plan"
+    run_plan(argparse.Namespace(
+        tree=tree,
+        skeleton_tree=groups,
+        output=str(output),
+        min_genomes=3,
+        max_genomes=5,
+        exclude_skeleton=False,
+        outliers=str(outliers),
+        verbose=False,
+        statistic=False,
+        statistic_file_type="json",
+    ))
+
+    # Preorder: every skeleton leaf in tree order followed by its group, then the outliers
+    preorder = ["A", "a1", "a2", "B", "b1", "C", "c1", "c2", "c3", "c4", "c5", "D", "o1", "o2"]
+    paths = [f"/data/{name}.gz" for name in preorder]
+    batches = cut_batches_from_plan(paths, read_batch_plan(str(output / "batch_plan.tsv")))
+    assert [[genome_name(p) for p in batch] for batch in batches] == [
+        ["A", "a1", "a2", "B", "b1"],
+        ["C", "c1", "c2", "c3", "c4"],
+        ["c5", "D", "o1", "o2"],
+    ]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from phylopack.preorder.catalog import GenomeCatalog
+from phylopack.preorder.placement import group_placements, group_size_histogram
+
+def nearest_fixture():
+    # Nearest reference, its distance and the second nearest reference (-1 if none) per query
+    idx = np.array([1, 0, 1, 2, 1, 0, 1, 1])
+    dist = np.array([0.1, 0.2, 0.05, 1.0, 0.3, 0.1, 0.2, 0.15])
+    idx2 = np.array([2, 1, 0, 0, 2, -1, 0, -1])
+    return idx, dist, idx2
+
+def test_group_placements_by_nearest_reference():
+    order, offsets, breaks, outliers, oversized = group_placements(nearest_fixture(), 3)
+    assert order.tolist() == [1, 5, 0, 2, 4, 6, 7, 3]
+    assert offsets.tolist() == [0, 2, 7, 8]
+    assert breaks.tolist() == []
+    assert outliers.tolist() == []
+    assert oversized == 0
+
+def test_group_placements_flags_outliers():
+    order, offsets, _, outliers, _ = group_placements(nearest_fixture(), 3, outlier_distance=1.0)
+    assert order.tolist() == [1, 5, 0, 2, 4, 6, 7]
+    assert offsets.tolist() == [0, 2, 7, 7]
+    assert outliers.tolist() == [3]
+
+def test_group_placements_splits_oversized_groups():
+    order, offsets, breaks, outliers, oversized = group_placements(
+        nearest_fixture(), 3, outlier_distance=1.0, max_group_size=3
+    )
+    # Reference 1's group, by second nearest reference (its own when unknown), then distance
+    assert order.tolist() == [1, 5, 2, 6, 7, 0, 4]
+    assert offsets.tolist() == [0, 2, 7, 7]
+    assert breaks.tolist() == [4, 5]
+    assert outliers.tolist() == [3]
+    assert oversized == 1
+
+@pytest.mark.parametrize("sizes, expected", [
+    ([0, 1, 2, 3, 4, 7, 8, 1, 0], {"0": 2, "1": 2, "2-3": 2, "4-7": 2, "8-15": 1}),
+    ([5, 16, 2], {"2-3": 1, "4-7": 1, "16-31": 1}),
+    ([], {}),
+])
+def test_group_size_histogram(sizes, expected):
+    histogram = group_size_histogram(np.array(sizes, dtype=np.int64))
+    assert histogram == expected
+    assert list(histogram) == list(expected)
+
+CATALOG_PATHS = ["/data/gB.fa.gz", "/other/gA.fa.gz", "/data/gC_long.fa.gz", "/data/gA0.fna"]
+
+def write_list(path, paths):
+    path.write_text("".join(p + "\n" for p in paths))
+    return str(path)
+
+def test_catalog_lookup():
+    catalog = GenomeCatalog.from_paths(CATALOG_PATHS)
+    assert len(catalog) == 4
+    assert catalog.names(range(4)) == ["gB.fa", "gA.fa", "gC_long.fa", "gA0"]
+    assert catalog.paths([1, 3]) == ["/other/gA.fa.gz", "/data/gA0.fna"]
+    # Names past every stored one and longer than the fixed width are missing, not truncated
+    queries = ["gC_long.fa", "gA0", "gA.fa", "gA", "zz", "gB.fa_longer_than_any_name", ""]
+    assert catalog.lookup(queries).tolist() == [2, 3, 1, -1, -1, -1, -1]
+    with pytest.raises(KeyError, match="from list.txt"):
+        catalog.ids(["gB.fa", "gD.fa"], "list.txt")
+    assert GenomeCatalog.from_paths([]).lookup(["gA.fa"]).tolist() == [-1]
+
+def test_catalog_duplicate_names():
+    # The same path listed twice keeps its first ID
+    catalog = GenomeCatalog.from_paths(CATALOG_PATHS + ["/other/gA.fa.gz", "/data/gB.fa.gz"])
+    assert catalog.paths(range(len(catalog))) == CATALOG_PATHS
+    with pytest.raises(ValueError, match="Genomes sharing a name: gA.fa"):
+        GenomeCatalog.from_paths(CATALOG_PATHS + ["/data/gA.fa.xz"])
+
+def test_catalog_save_load_round_trip(tmp_path):
+    catalog = GenomeCatalog.from_list(write_list(tmp_path / "genomes.txt", CATALOG_PATHS))
+    catalog.save(str(tmp_path / "genome_catalog.npz"))
+    loaded = GenomeCatalog.load(str(tmp_path / "genome_catalog.npz"))
+    assert loaded.names(range(len(loaded))) == catalog.names(range(len(catalog)))
+    assert loaded.paths(range(len(loaded))) == CATALOG_PATHS
+    assert loaded.lookup(["gA0", "gB.fa", "missing"]).tolist() == [3, 0, -1]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1 << 16])
+def test_catalog_list_ids(tmp_path, chunk_size):
+    catalog = GenomeCatalog.from_paths(CATALOG_PATHS)
+    # Lists are matched by name, whatever folder they point to
+    genomes = write_list(tmp_path / "query.txt", ["/data/gA0.fna", "/mirror/gA.fa.gz", "/data/gB.fa.gz"])
+    assert catalog.list_ids(genomes, chunk_size).tolist() == [3, 1, 0]
+    missing = write_list(tmp_path / "missing.txt", ["/data/gB.fa.gz", "/data/gD.fa.gz"])
+    with pytest.raises(KeyError, match="gD.fa"):
+        catalog.list_ids(missing, chunk_size)